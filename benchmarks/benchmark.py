@@ -0,0 +1,261 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from mock_server import MockGraphQLServer, SyntheticProject
+
+"""
+Runs the action against a local mock GraphQL server and reports wall time,
+request count, bytes transferred and peak memory.
+
+Each run is a separate process so the action's config is read fresh and the
+peak RSS belongs to the action alone. The first run of a scenario starts
+from an empty state dir, the following ones reuse it (steady state).
+
+With --replay the action answers every request from a recorded cassette
+instead (see INPUT_TRANSPORT_MODE), and --max-requests fails the benchmark
+when a run sends more requests than allowed.
+
+    python benchmarks/benchmark.py
+    python benchmarks/benchmark.py --items 5000 --timeline 200 --latency-ms 40
+    python benchmarks/benchmark.py --env INPUT_DEEP_SNAPSHOT=True --json out.json
+    python benchmarks/benchmark.py --replay board.json --state-dir state/ --max-requests 5
+"""
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+SCENARIOS = {
+    "small": {"items": 200, "timeline": 10, "comments": 3},
+    "medium": {"items": 2000, "timeline": 50, "comments": 10},
+    "large": {"items": 10000, "timeline": 100, "comments": 20},
+}
+
+
+def child_main():
+    """Runs the action once in this process and prints its measurements as JSON."""
+    sys.path.insert(0, SRC_DIR)
+    import main
+    import transport
+
+    # Keep the transport's request counts, main() closes it before returning
+    request_counts = Counter()
+
+    def close_transport():
+        if transport._transport is not None:
+            request_counts.update(transport._transport.request_counts)
+        transport.close_transport()
+
+    main.close_transport = close_transport
+
+    started = time.perf_counter()
+    main.main()
+    wall_time = time.perf_counter() - started
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(
+        json.dumps(
+            {
+                "wall_time": wall_time,
+                "peak_rss": peak_rss,
+                "operations": dict(request_counts),
+            }
+        )
+    )
+
+
+def action_env(url, extra):
+    env = {
+        key: value
+        for key, value in os.environ.items()
+        if not key.startswith(("INPUT_", "GITHUB_"))
+    }
+    env.update(
+        {
+            "GITHUB_REPOSITORY_OWNER": "bench",
+            "GITHUB_REPOSITORY": "bench/repo",
+            "GITHUB_SERVER_URL": "https://example.test",
+            "GITHUB_GRAPHQL_URL": url,
+            "INPUT_REPOSITORY_OWNER_TYPE": "organization",
+            "INPUT_ENTERPRISE_GITHUB": "True",
+            "INPUT_GH_TOKEN": "bench-token",
+            "INPUT_PROJECT_NUMBER": "1",
+            "INPUT_PROJECT_TITLE": "Bench",
+            "INPUT_STATUS_FIELD_NAME": "Status",
+        }
+    )
+    env.update(extra)
+    return env
+
+
+def run_action(name, runs, env, state_dir, server=None, verbose=False):
+    results = []
+    for run in range(runs):
+        if server:
+            server.reset_stats()
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child"],
+            env=dict(env, INPUT_STATE_DIR=state_dir),
+            stdout=subprocess.PIPE,
+            stderr=None if verbose else subprocess.DEVNULL,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"{name} run {run + 1} exited with {process.returncode}")
+        measured = json.loads(process.stdout.strip().splitlines()[-1])
+        result = {
+            "scenario": name,
+            "run": run + 1,
+            "wall_time": round(measured["wall_time"], 3),
+            "peak_rss": measured["peak_rss"],
+            "requests": sum(measured["operations"].values()),
+            "errors_injected": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "operations": measured["operations"],
+        }
+        if server:
+            result.update(
+                {
+                    "errors_injected": server.stats["errors_injected"],
+                    "bytes_in": server.stats["bytes_in"],
+                    "bytes_out": server.stats["bytes_out"],
+                }
+            )
+        results.append(result)
+    return results
+
+
+def run_scenario(name, options, extra_env, runs, verbose=False):
+    project = SyntheticProject(
+        items=options["items"],
+        open_ratio=options["open_ratio"],
+        linked_ratio=options["linked_ratio"],
+        timeline=options["timeline"],
+        comments=options["comments"],
+        seed=options["seed"],
+    )
+    server = MockGraphQLServer(
+        project,
+        latency=options["latency_ms"] / 1000,
+        error_rate=options["error_rate"],
+        seed=options["seed"],
+    )
+    url = server.start()
+    try:
+        with tempfile.TemporaryDirectory() as state_dir:
+            env = action_env(url, extra_env)
+            return run_action(name, runs, env, state_dir, server, verbose)
+    finally:
+        server.stop()
+
+
+def run_replay(cassette_path, initial_state_dir, extra_env, runs, verbose=False):
+    with open(cassette_path) as f:
+        context = json.load(f).get("context") or {}
+    cassette_path = os.path.abspath(cassette_path)
+    with tempfile.TemporaryDirectory() as state_dir:
+        if initial_state_dir:
+            shutil.copytree(initial_state_dir, state_dir, dirs_exist_ok=True)
+        env = action_env("http://replay.invalid/api/graphql", context)
+        env.update(
+            {"INPUT_TRANSPORT_MODE": "replay", "INPUT_CASSETTE_PATH": cassette_path}
+        )
+        env.update(extra_env)
+        name = os.path.splitext(os.path.basename(cassette_path))[0]
+        return run_action(name, runs, env, state_dir, verbose=verbose)
+
+
+def print_table(results):
+    header = f"{'scenario':<10} {'run':>3} {'wall s':>8} {'requests':>8} {'KB in':>9} {'KB out':>9} {'peak MB':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['scenario']:<10} {r['run']:>3} {r['wall_time']:>8.2f} {r['requests']:>8} "
+            f"{r['bytes_in'] / 1024:>9.1f} {r['bytes_out'] / 1024:>9.1f} {r['peak_rss'] / 2**20:>8.1f}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the action against a local mock GraphQL server"
+    )
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), action="append",
+                        help="Predefined scenario(s) to run (default: all, unless --items is given)")
+    parser.add_argument("--items", type=int, help="Project items in a custom scenario")
+    parser.add_argument("--timeline", type=int, help="Timeline events per issue")
+    parser.add_argument("--comments", type=int, help="Comments per issue")
+    parser.add_argument("--open-ratio", type=float, default=0.3)
+    parser.add_argument("--linked-ratio", type=float, default=0.1)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--runs", type=int, default=2, help="Runs per scenario sharing one state dir")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the action, e.g. INPUT_BATCH_SIZE=100")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Replay a recorded cassette instead of using the mock server")
+    parser.add_argument("--state-dir", help="State dir copied in before a replayed run (default: empty)")
+    parser.add_argument("--max-requests", type=int, help="Fail when a run sends more requests than this")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show the action's log output")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        child_main()
+        sys.exit(0)
+
+    common = {
+        "open_ratio": args.open_ratio,
+        "linked_ratio": args.linked_ratio,
+        "latency_ms": args.latency_ms,
+        "error_rate": args.error_rate,
+        "seed": args.seed,
+    }
+    if args.items is not None:
+        scenarios = {
+            "custom": {
+                "items": args.items,
+                "timeline": args.timeline if args.timeline is not None else 20,
+                "comments": args.comments if args.comments is not None else 5,
+            }
+        }
+    else:
+        scenarios = {name: SCENARIOS[name] for name in (args.scenario or SCENARIOS)}
+
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    results = []
+    if args.replay:
+        results = run_replay(args.replay, args.state_dir, extra_env, args.runs, args.verbose)
+    else:
+        for name, scenario in scenarios.items():
+            options = dict(common, **scenario)
+            for key in ("timeline", "comments"):
+                if getattr(args, key) is not None:
+                    options[key] = getattr(args, key)
+            results.extend(run_scenario(name, options, extra_env, args.runs, args.verbose))
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.max_requests is not None:
+        over = [r for r in results if r["requests"] > args.max_requests]
+        for r in over:
+            print(
+                f"{r['scenario']} run {r['run']} sent {r['requests']} requests "
+                f"(max {args.max_requests}): {r['operations']}"
+            )
+        if over:
+            sys.exit(1)
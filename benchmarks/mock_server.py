@@ -0,0 +1,464 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+import gzip
+import json
+import random
+import re
+import threading
+import time
+
+"""
+A local stand-in for the GitHub GraphQL API, serving a synthetic project.
+
+It doesn't parse GraphQL: requests are dispatched on their operation name
+and answered from the variables, which is enough for the documents the
+action sends. Fields whose name doesn't appear in the query are left out of
+the response, so payload sizes follow the selections. Latency and 502 errors can be injected, and every request is
+counted with its size so runs can be compared.
+"""
+
+LINKING_EVENTS = ("CrossReferencedEvent", "ConnectedEvent")
+OTHER_EVENTS = ("LabeledEvent", "AssignedEvent", "IssueComment", "ReferencedEvent")
+STATUSES = ("Todo", "In Progress", "QA Testing", "Done")
+
+OPERATION_PATTERN = re.compile(r"^\s*(query|mutation)\s+(\w+)", re.MULTILINE)
+NAME_PATTERN = re.compile(r"\w+")
+
+
+def timestamp(seconds):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(seconds))
+
+
+class SyntheticProject:
+    """
+    A project of `items` issues. open_ratio of them are open, linked_ratio of
+    those were referenced by a PR merged into dev, and every issue has
+    `timeline` timeline events and `comments` comments. other_repo_ratio of
+    the issues belong to another repository than bench/repo.
+    """
+
+    def __init__(
+        self,
+        items=1000,
+        open_ratio=0.3,
+        linked_ratio=0.1,
+        timeline=20,
+        comments=5,
+        title="Bench",
+        seed=1,
+        other_repo_ratio=0.0,
+    ):
+        rng = random.Random(seed)
+        self.title = title
+        self.project_id = "PVT_bench"
+        self.status_options = {name: f"OPT_{i}" for i, name in enumerate(STATUSES)}
+        self.issues = []
+        self.issues_by_id = {}
+        self.items_by_id = {}
+        self.pull_requests = []
+        now = time.time()
+
+        for number in range(1, items + 1):
+            updated_at = now - rng.randint(60, 90 * 86400)
+            issue = {
+                "id": f"I_{number}",
+                "item_id": f"PVTI_{number}",
+                "number": number,
+                "repository": "bench/repo",
+                "state": "OPEN" if rng.random() < open_ratio else "CLOSED",
+                "status": rng.choice(STATUSES),
+                "updatedAt": timestamp(updated_at),
+                "timeline": [],
+                "comments": [],
+            }
+            if other_repo_ratio and rng.random() < other_repo_ratio:
+                issue["repository"] = "bench/other"
+            for index in range(timeline):
+                issue["timeline"].append({"__typename": rng.choice(OTHER_EVENTS)})
+            for index in range(comments):
+                issue["comments"].append(
+                    {
+                        "body": f"Comment {index} on #{number}",
+                        "createdAt": timestamp(updated_at - (comments - index) * 3600),
+                        "author": {"login": f"user{rng.randint(1, 20)}"},
+                    }
+                )
+
+            if issue["state"] == "OPEN" and rng.random() < linked_ratio:
+                merged_at = now - rng.randint(60, 30 * 86400)
+                pr = {
+                    "id": f"PR_{number}",
+                    "number": 100000 + number,
+                    "url": f"https://example.test/bench/repo/pull/{100000 + number}",
+                    "title": f"Fix #{number}",
+                    "body": f"Closes #{number}",
+                    "mergedAt": timestamp(merged_at),
+                    "updatedAt": timestamp(merged_at),
+                    "baseRefName": "dev",
+                    "issue_id": issue["id"],
+                }
+                self.pull_requests.append(pr)
+                position = rng.randint(0, len(issue["timeline"]))
+                issue["timeline"].insert(
+                    position, {"__typename": "CrossReferencedEvent", "source": pr}
+                )
+
+            self.issues.append(issue)
+            self.issues_by_id[issue["id"]] = issue
+            self.items_by_id[issue["item_id"]] = issue
+
+        self.pull_requests.sort(key=lambda pr: pr["updatedAt"], reverse=True)
+        self.issues_by_number = {issue["number"]: issue for issue in self.issues}
+
+
+class MockGraphQLServer:
+    def __init__(self, project, latency=0.0, error_rate=0.0, seed=1):
+        self.project = project
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {
+            "requests": 0,
+            "errors_injected": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "operations": Counter(),
+        }
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api/graphql"
+
+    def start(self, host="127.0.0.1", port=0):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                status, payload = mock.respond(body)
+                data = json.dumps(payload).encode()
+                if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                    data = gzip.compress(data)
+                    encoding = "gzip"
+                else:
+                    encoding = None
+                with mock._lock:
+                    mock.stats["bytes_in"] += len(body)
+                    mock.stats["bytes_out"] += len(data)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if encoding:
+                    self.send_header("Content-Encoding", encoding)
+                self.send_header("X-RateLimit-Remaining", "5000")
+                self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def respond(self, body):
+        request = json.loads(body or b"{}")
+        query = request.get("query") or ""
+        variables = request.get("variables") or {}
+        match = OPERATION_PATTERN.search(query)
+        operation = match.group(2) if match else "anonymous"
+
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats["operations"][operation] += 1
+            inject_error = self.error_rate and self._rng.random() < self.error_rate
+            if inject_error:
+                self.stats["errors_injected"] += 1
+        if inject_error:
+            return 502, {"message": "Server Error"}
+
+        handler = getattr(self, f"_op_{operation}", None)
+        if handler is None and "projectsV2" in query:
+            handler = self._op_projects
+        if handler is None:
+            return 200, {"errors": [{"message": f"Unknown operation {operation}"}]}
+        with self._lock:
+            response = handler(query, variables)
+        if response.get("data") is not None and "rateLimit" in query:
+            response["data"]["rateLimit"] = self._rate_limit()
+        if "data" in response:
+            response["data"] = self._select(response["data"], set(NAME_PATTERN.findall(query)))
+        return 200, response
+
+    # Helpers
+
+    @classmethod
+    def _select(cls, value, names):
+        """Drops the keys of the response that the query didn't ask for."""
+        if isinstance(value, dict):
+            return {k: cls._select(v, names) for k, v in value.items() if k in names}
+        if isinstance(value, list):
+            return [cls._select(v, names) for v in value]
+        return value
+
+    @staticmethod
+    def _window(nodes, last=None, before=None, first=None, after=None):
+        """Slices a list the way a GraphQL connection would, with index cursors."""
+        if first is not None:
+            start = int(after) if after else 0
+            end = min(start + first, len(nodes))
+            page = {"endCursor": str(end), "hasNextPage": end < len(nodes)}
+        else:
+            end = int(before) if before else len(nodes)
+            start = max(0, end - (last or len(nodes)))
+            page = {"startCursor": str(start), "hasPreviousPage": start > 0}
+        return nodes[start:end], page
+
+    def _timeline(self, issue, query, last, before=None, since=None):
+        events = issue["timeline"]
+        if "itemTypes" in query:
+            events = [e for e in events if e["__typename"] in LINKING_EVENTS]
+        nodes, page = self._window(events, last=last, before=before)
+        return {"nodes": nodes, "pageInfo": page}
+
+    def _comments(self, issue, last=None, before=None, first=None, after=None):
+        nodes, page = self._window(
+            issue["comments"], last=last, before=before, first=first, after=after
+        )
+        return {"nodes": nodes, "pageInfo": page}
+
+    def _item(self, issue, deep=False):
+        content = {
+            "id": issue["id"],
+            "title": f"Issue {issue['number']}",
+            "number": issue["number"],
+            "state": issue["state"],
+            "url": f"https://example.test/bench/repo/issues/{issue['number']}",
+            "updatedAt": issue["updatedAt"],
+            "repository": {"nameWithOwner": issue["repository"]},
+        }
+        if deep:
+            content["timelineItems"] = self._timeline(issue, "itemTypes", last=5)
+            content["comments"] = self._comments(issue, last=5)
+        return {
+            "id": issue["item_id"],
+            "updatedAt": issue["updatedAt"],
+            "fieldValueByName": {"id": "FV", "name": issue["status"]},
+            "content": content,
+        }
+
+    def _linked_issue(self, issue):
+        return {
+            "id": issue["id"],
+            "number": issue["number"],
+            "state": issue["state"],
+            "projectItems": {
+                "nodes": [
+                    {
+                        "id": issue["item_id"],
+                        "project": {"id": self.project.project_id},
+                        "fieldValueByName": {"name": issue["status"]},
+                    }
+                ]
+            },
+        }
+
+    def _closing_issues(self, pr, first, after=None):
+        issue = self.project.issues_by_id[pr["issue_id"]]
+        nodes, page = self._window([self._linked_issue(issue)], first=first, after=after)
+        return {"nodes": nodes, "pageInfo": page}
+
+    def _pull_request(self, pr):
+        return dict(
+            {k: v for k, v in pr.items() if k != "issue_id"},
+            closingIssuesReferences=self._closing_issues(pr, first=25),
+        )
+
+    @staticmethod
+    def _rate_limit():
+        return {"cost": 1, "remaining": 5000, "resetAt": timestamp(time.time() + 3600)}
+
+    # Operations
+
+    def _op_GetViewer(self, query, variables):
+        return {"data": {"viewer": {"login": "bench-bot"}}}
+
+    def _op_projects(self, query, variables):
+        project = {"id": self.project.project_id, "title": self.project.title}
+        return {"data": {"organization": {"projectsV2": {"nodes": [project]}}}}
+
+    def _op_GetProjectFields(self, query, variables):
+        options = [{"id": i, "name": n} for n, i in self.project.status_options.items()]
+        field = {
+            "__typename": "ProjectV2SingleSelectField",
+            "id": "PVTSSF_status",
+            "name": "Status",
+            "options": options,
+        }
+        return {"data": {"node": {"fields": {"nodes": [field]}}}}
+
+    def _matches(self, issue, items_filter):
+        """Applies the subset of the project filter syntax the action sends."""
+        for term in re.findall(r'-?[\w-]+:(?:"[^"]*"|\S+)', items_filter or ""):
+            key, _, value = term.partition(":")
+            value = value.strip('"')
+            if term == "is:open" and issue["state"] != "OPEN":
+                return False
+            if key == "repo" and value != issue["repository"]:
+                return False
+            if key.startswith("-") and issue["status"] == value:
+                return False
+            if key == "updated" and issue["updatedAt"][:10] < value.lstrip(">="):
+                return False
+        return True
+
+    def _project_items(self, query, variables, deep):
+        issues = self.project.issues
+        if variables.get("query"):
+            issues = [i for i in issues if self._matches(i, variables["query"])]
+        nodes, page = self._window(
+            issues, first=variables.get("first"), after=variables.get("after")
+        )
+        items = {"nodes": [self._item(i, deep) for i in nodes], "pageInfo": page}
+        owner_type = "user" if "user(login" in query else "organization"
+        return {
+            "data": {
+                owner_type: {"projectV2": {"id": self.project.project_id, "items": items}},
+            }
+        }
+
+    def _op_GetProjectItems(self, query, variables):
+        return self._project_items(query, variables, deep=False)
+
+    def _op_GetProjectItemsDeep(self, query, variables):
+        return self._project_items(query, variables, deep=True)
+
+    def _op_GetRepoOpenIssues(self, query, variables):
+        repository = f"{variables['owner']}/{variables['repo']}"
+        open_issues = [
+            i for i in self.project.issues if i["state"] == "OPEN" and i["repository"] == repository
+        ]
+        nodes, page = self._window(
+            open_issues, first=variables.get("first"), after=variables.get("after")
+        )
+        issues = [
+            {"id": i["id"], "number": i["number"], "updatedAt": i["updatedAt"]}
+            for i in nodes
+        ]
+        return {
+            "data": {
+                "repository": {"issues": {"nodes": issues, "pageInfo": page}},
+            }
+        }
+
+    def _op_GetIssueTimeline(self, query, variables):
+        issue = self.project.issues_by_id[variables["issueId"]]
+        timeline = self._timeline(
+            issue, query, variables.get("last"), variables.get("before")
+        )
+        return {"data": {"node": {"timelineItems": timeline}}}
+
+    def _op_GetIssuesTimelines(self, query, variables):
+        nodes = []
+        for issue_id in variables["ids"]:
+            issue = self.project.issues_by_id[issue_id]
+            timeline = self._timeline(issue, query, variables.get("last"))
+            nodes.append({"id": issue_id, "timelineItems": timeline})
+        return {"data": {"nodes": nodes}}
+
+    def _op_GetIssueCommentsSince(self, query, variables):
+        issue = self.project.issues_by_id[variables["issueId"]]
+        comments = self._comments(
+            issue, last=variables.get("last"), before=variables.get("before")
+        )
+        return {"data": {"node": {"comments": comments}}}
+
+    def _op_GetIssuesCommentsSince(self, query, variables):
+        nodes = []
+        for issue_id in variables["ids"]:
+            issue = self.project.issues_by_id[issue_id]
+            comments = self._comments(issue, last=variables.get("last"))
+            nodes.append({"id": issue_id, "comments": comments})
+        return {"data": {"nodes": nodes}}
+
+    def _op_GetMergedDevPullRequests(self, query, variables):
+        nodes, page = self._window(
+            self.project.pull_requests, first=50, after=variables.get("after")
+        )
+        pull_requests = {"nodes": [self._pull_request(pr) for pr in nodes], "pageInfo": page}
+        return {"data": {"repository": {"pullRequests": pull_requests}}}
+
+    def _op_GetPullRequest(self, query, variables):
+        for pr in self.project.pull_requests:
+            if pr["number"] == variables["number"]:
+                return {"data": {"repository": {"pullRequest": self._pull_request(pr)}}}
+        return {"data": {"repository": {"pullRequest": None}}}
+
+    def _op_GetClosingIssues(self, query, variables):
+        for pr in self.project.pull_requests:
+            if pr["number"] == variables["number"]:
+                closing = self._closing_issues(pr, variables.get("first"), variables.get("after"))
+                return {"data": {"repository": {"pullRequest": {"closingIssuesReferences": closing}}}}
+        return {"data": {"repository": {"pullRequest": None}}}
+
+    def _op_GetIssuesProjectItems(self, query, variables):
+        nodes = []
+        for issue_id in variables["ids"]:
+            issue = self.project.issues_by_id.get(issue_id)
+            nodes.append(self._linked_issue(issue) if issue else None)
+        return {"data": {"nodes": nodes}}
+
+    def _op_GetIssuesByNumber(self, query, variables):
+        repository = {}
+        for alias, number in re.findall(r"(\w+):\s*issue\(number:\s*(\d+)\)", query):
+            issue = self.project.issues_by_number.get(int(number))
+            repository[alias] = self._linked_issue(issue) if issue else None
+        return {"data": {"repository": repository}}
+
+    def _add_comment(self, issue_id, body):
+        issue = self.project.issues_by_id[issue_id]
+        issue["updatedAt"] = timestamp(time.time())
+        issue["comments"].append(
+            {
+                "body": body,
+                "createdAt": timestamp(time.time()),
+                "author": {"login": "bench-bot"},
+            }
+        )
+        return {"commentEdge": {"node": {"id": f"IC_{issue_id}"}}}
+
+    def _update_status(self, item_id, option_id):
+        names = {i: n for n, i in self.project.status_options.items()}
+        issue = self.project.items_by_id[item_id]
+        issue["status"] = names[option_id]
+        issue["updatedAt"] = timestamp(time.time())
+        return {"projectV2Item": {"id": item_id}}
+
+    def _op_BatchedMutation(self, query, variables):
+        data = {}
+        for alias, field in re.findall(r"(m\d+): (\w+)\(", query):
+            index = alias[1:]
+            if field == "addComment":
+                data[alias] = self._add_comment(
+                    variables[f"subjectId_{index}"], variables[f"body_{index}"]
+                )
+            elif field == "updateProjectV2ItemFieldValue":
+                data[alias] = self._update_status(
+                    variables[f"itemId_{index}"], variables[f"statusOptionId_{index}"]
+                )
+        return {"data": data}
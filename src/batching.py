@@ -0,0 +1,154 @@
+import logging
+import re
+from engine import map_concurrently
+
+
+class BatchLoader:
+    """
+    Coalesces per-node reads into batched requests, DataLoader style.
+
+    batch_fn receives a list of keys and returns a dict mapping each key to
+    its value. load_many() fetches the keys not cached yet, batch_size keys
+    per request, with up to `concurrency` batches sent at the same time.
+    """
+
+    def __init__(self, batch_fn, batch_size=50, concurrency=1):
+        self.batch_fn = batch_fn
+        self.batch_size = max(1, batch_size)
+        self.concurrency = concurrency
+        self._cache = {}
+
+    def prime_value(self, key, value):
+        """Seeds the cache with a value that is already known, e.g. from a snapshot."""
+        self._cache[key] = value
+
+    def load_many(self, keys):
+        keys = list(keys)
+        missing = list(dict.fromkeys(key for key in keys if key not in self._cache))
+        batches = [
+            missing[start : start + self.batch_size]
+            for start in range(0, len(missing), self.batch_size)
+        ]
+        for batch, results in zip(
+            batches, map_concurrently(self.batch_fn, batches, self.concurrency)
+        ):
+            self._store(batch, results)
+        return {key: self._cache[key] for key in keys}
+
+    def _store(self, batch, results):
+        results = results or {}
+        for key in batch:
+            self._cache[key] = results.get(key)
+
+
+class MutationOperation:
+    """
+    A single mutation field, e.g. "addComment(input: {subjectId: $subjectId, ...}) { ... }",
+    together with the types and values of the variables it references.
+    """
+
+    def __init__(self, field, variable_types, variables):
+        self.field = field
+        self.variable_types = variable_types
+        self.variables = variables
+
+
+class MutationBatcher:
+    """
+    Groups queued mutation operations into aliased mutation documents of at
+    most batch_size operations each.
+
+    send_fn receives (document, variables) and returns the decoded response
+    body (or None on transport failure). Errors are attributed to the alias in
+    their path, so one failed operation doesn't fail the rest of the batch.
+    In dry-run mode the batched plan is logged instead of sent. Up to
+    `concurrency` batches are sent at the same time.
+    """
+
+    def __init__(self, send_fn, batch_size=20, dry_run=False, concurrency=1):
+        self.send_fn = send_fn
+        self.batch_size = max(1, batch_size)
+        self.dry_run = dry_run
+        self.concurrency = concurrency
+        self._queue = []
+        self.errors = []
+
+    def add(self, key, operation):
+        self._queue.append((key, operation))
+
+    def flush(self):
+        """
+        Sends every queued operation and returns {key: result}, where result
+        is the field's data, or None if that operation failed. The GraphQL
+        errors seen are kept in self.errors.
+        """
+        results = {}
+        self.errors = []
+        queue, self._queue = self._queue, []
+        batches = [
+            queue[start : start + self.batch_size]
+            for start in range(0, len(queue), self.batch_size)
+        ]
+        for batch_results in map_concurrently(self._send, batches, self.concurrency):
+            results.update(batch_results)
+        return results
+
+    def _send(self, batch):
+        document, variables, aliases = build_mutation_document(
+            [operation for _, operation in batch]
+        )
+        if self.dry_run:
+            logging.info(
+                f"DRY RUN: would send {len(batch)} mutation(s) in one request:\n"
+                f"{document}\nvariables: {variables}"
+            )
+            return {key: {"dryRun": True} for key, _ in batch}
+
+        data = self.send_fn(document, variables)
+        if data is None:
+            return {key: None for key, _ in batch}
+
+        failed = set()
+        self.errors.extend(data.get("errors") or [])
+        for error in data.get("errors") or []:
+            path = error.get("path") or []
+            if path and path[0] in aliases:
+                failed.add(path[0])
+                logging.error(f"Mutation {path[0]} failed: {error.get('message')}")
+            else:
+                # Document level error, nothing in the batch was applied
+                logging.error(f"GraphQL mutation errors: {error}")
+                return {key: None for key, _ in batch}
+
+        payload = data.get("data") or {}
+        return {
+            key: None if alias in failed else payload.get(alias)
+            for (key, _), alias in zip(batch, aliases)
+        }
+
+
+def build_mutation_document(operations):
+    """
+    Builds a single aliased mutation from the given operations, suffixing each
+    operation's variables with its index so they don't collide.
+    """
+    fields = []
+    declarations = []
+    variables = {}
+    aliases = []
+    for index, operation in enumerate(operations):
+        alias = f"m{index}"
+        aliases.append(alias)
+        field = re.sub(
+            r"\$(\w+)", lambda m: f"${m.group(1)}_{index}", operation.field
+        )
+        fields.append(f"  {alias}: {field}")
+        for name, type_ in operation.variable_types.items():
+            declarations.append(f"${name}_{index}: {type_}")
+            variables[f"{name}_{index}"] = operation.variables[name]
+    document = (
+        f"mutation BatchedMutation({', '.join(declarations)}) {{\n"
+        + "\n".join(fields)
+        + "\n}"
+    )
+    return document, variables, aliases
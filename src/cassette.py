@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+
+"""
+Recorded GraphQL request/response pairs, for replaying a run without network access
+"""
+
+VERSION = 1
+
+OPERATION_PATTERN = re.compile(r"^\s*(?:query|mutation)\s+(\w+)", re.MULTILINE)
+TOKEN_PATTERN = re.compile(r"\b(?:gh[pousr]_[A-Za-z0-9]{20,}|github_pat_[A-Za-z0-9_]{20,})\b")
+TIMESTAMP_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?Z$")
+RECORDED_HEADERS = ("content-type", "x-ratelimit-remaining", "x-ratelimit-reset", "retry-after")
+SCRUBBED = "<scrubbed>"
+
+
+# Variables left out of the key: the page size adapts to response times,
+# so a replay asks for different sizes than the recording did
+UNKEYED_VARIABLES = ("first",)
+
+
+class CassetteMiss(LookupError):
+    """Raised when replaying a request that the cassette has no response for."""
+
+
+def operation_name(query):
+    match = OPERATION_PATTERN.search(query or "")
+    return match.group(1) if match else "anonymous"
+
+
+def query_hash(query):
+    # Whitespace only differs with indentation, so it doesn't change the key
+    normalized = " ".join((query or "").split())
+    return hashlib.sha256(normalized.encode()).hexdigest()[:16]
+
+
+def _loosen(value):
+    """Replaces timestamps, which move from run to run (e.g. `since`), with a placeholder."""
+    if isinstance(value, dict):
+        return {k: _loosen(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_loosen(v) for v in value]
+    if isinstance(value, str) and TIMESTAMP_PATTERN.match(value):
+        return "<timestamp>"
+    return value
+
+
+def interaction_key(query, variables, loose=False):
+    variables = {k: v for k, v in (variables or {}).items() if k not in UNKEYED_VARIABLES}
+    if loose:
+        variables = _loosen(variables)
+    return f"{query_hash(query)}:{json.dumps(variables, sort_keys=True)}"
+
+
+class Cassette:
+    """
+    The interactions of a run in the order they happened. Replaying answers
+    a request with the next unused response recorded for the same query hash
+    and variables; if there is none left, the last one is repeated, and a
+    request whose variables only differ in timestamps also matches.
+    """
+
+    def __init__(self, path, secrets=(), context=None):
+        self.path = path
+        self.secrets = [s for s in secrets if s]
+        self.context = context or {}
+        self.interactions = []
+        self._index = None
+        self._used = set()
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != VERSION:
+            raise ValueError(f"Unsupported cassette version {data.get('version')}")
+        cassette = cls(path, context=data.get("context"))
+        cassette.interactions = data.get("interactions", [])
+        return cassette
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "version": VERSION,
+                    "context": self.context,
+                    "interactions": self.interactions,
+                },
+                f,
+                indent=1,
+            )
+        os.replace(tmp_path, self.path)
+        logging.info(f"Recorded {len(self.interactions)} requests to {self.path}")
+
+    def scrub(self, text):
+        for secret in self.secrets:
+            text = text.replace(secret, SCRUBBED)
+        return TOKEN_PATTERN.sub(SCRUBBED, text)
+
+    def record(self, query, variables, status_code, headers, body):
+        """Adds an interaction; the request's own headers (Authorization) are never kept."""
+        scrubbed_variables = json.loads(self.scrub(json.dumps(variables)))
+        text = self.scrub(body.decode("utf-8", errors="replace"))
+        self.interactions.append(
+            {
+                "operation": operation_name(query),
+                "query_hash": query_hash(query),
+                "query": self.scrub(query),
+                "variables": scrubbed_variables,
+                "status": status_code,
+                "headers": {
+                    k.lower(): v
+                    for k, v in headers.items()
+                    if k.lower() in RECORDED_HEADERS
+                },
+                "body": text,
+            }
+        )
+
+    def _build_index(self):
+        self._index = defaultdict(list)
+        for interaction in self.interactions:
+            query, variables = interaction["query"], interaction["variables"]
+            self._index[interaction_key(query, variables)].append(interaction)
+            self._index["~" + interaction_key(query, variables, loose=True)].append(interaction)
+
+    def find(self, query, variables):
+        """Returns the recorded interaction answering this request, or None."""
+        if self._index is None:
+            self._build_index()
+        query = self.scrub(query)
+        variables = json.loads(self.scrub(json.dumps(variables)))
+        for key in (
+            interaction_key(query, variables),
+            "~" + interaction_key(query, variables, loose=True),
+        ):
+            candidates = self._index.get(key)
+            if not candidates:
+                continue
+            for interaction in candidates:
+                if id(interaction) not in self._used:
+                    self._used.add(id(interaction))
+                    return interaction
+            return candidates[-1]
+        return None
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+import time
+import config
+import state
+
+"""
+Checkpoint of the previous run, used by incremental mode
+"""
+
+CHECKPOINT_FILE = "checkpoint.json"
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+def format_timestamp(moment):
+    """Formats a datetime the way GitHub does, so timestamps compare as strings."""
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def parse_timestamp(value):
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+
+class Deadline:
+    """
+    A time budget in seconds, 0 for none, counted from its creation.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.started = time.monotonic()
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def expired(self, share=1.0):
+        """Whether the given share of the budget has been used up."""
+        return bool(self.seconds) and self.elapsed() >= self.seconds * share
+
+    def split(self, parts):
+        """
+        A Deadline for an even share of the time left between `parts` consumers,
+        at least a second. Without a budget, neither has one.
+        """
+        if not self.seconds:
+            return Deadline(0)
+        return Deadline(max((self.seconds - self.elapsed()) / parts, 1))
+
+
+class Checkpoint:
+    def __init__(
+        self,
+        last_run_at=None,
+        last_full_scan_at=None,
+        resume_cursor=None,
+        sweep_started_at=None,
+    ):
+        self.last_run_at = last_run_at
+        self.last_full_scan_at = last_full_scan_at
+        # A full scan spread over several budgeted runs: the page cursor to
+        # continue from, and when the scan began
+        self.resume_cursor = resume_cursor
+        self.sweep_started_at = sweep_started_at
+
+    def needs_full_scan(self, now):
+        if not self.last_run_at or not self.last_full_scan_at:
+            return True
+        elapsed = now - parse_timestamp(self.last_full_scan_at)
+        return elapsed >= timedelta(minutes=config.full_scan_interval)
+
+    def updated_since(self):
+        """
+        Timestamp from which items have to be looked at again. Overlaps the
+        previous run slightly so edits racing with it aren't missed.
+        """
+        since = parse_timestamp(self.last_run_at) - timedelta(
+            seconds=config.incremental_overlap
+        )
+        return format_timestamp(since)
+
+    def to_dict(self):
+        return {
+            "last_run_at": self.last_run_at,
+            "last_full_scan_at": self.last_full_scan_at,
+            "resume_cursor": self.resume_cursor,
+            "sweep_started_at": self.sweep_started_at,
+        }
+
+
+def load_checkpoint():
+    data = state.load_json(state.target_file(CHECKPOINT_FILE), {})
+    return Checkpoint(
+        last_run_at=data.get("last_run_at"),
+        last_full_scan_at=data.get("last_full_scan_at"),
+        resume_cursor=data.get("resume_cursor"),
+        sweep_started_at=data.get("sweep_started_at"),
+    )
+
+
+def save_checkpoint(checkpoint):
+    state.save_json(state.target_file(CHECKPOINT_FILE), checkpoint.to_dict())
@@ -1,3 +1,4 @@
+import json
 import os
 
 repository_owner = os.environ['GITHUB_REPOSITORY_OWNER']
@@ -15,3 +16,119 @@ api_endpoint = os.environ.get('GITHUB_GRAPHQL_URL', 'https://github.intranet.uni
 status_field_name = os.environ['INPUT_STATUS_FIELD_NAME']
 
 repository_branch = os.environ.get('GITHUB_REF', '').rsplit('/', 1)[-1]
+
+# HTTP transport
+http_pool_size = int(os.environ.get('INPUT_HTTP_POOL_SIZE') or 10)
+http_timeout = float(os.environ.get('INPUT_HTTP_TIMEOUT') or 30)
+http_max_retries = int(os.environ.get('INPUT_HTTP_MAX_RETRIES') or 3)
+http_backoff_factor = float(os.environ.get('INPUT_HTTP_BACKOFF_FACTOR') or 0.5)
+
+# Number of issues resolved per batched GraphQL query (GitHub allows up to 100 node ids)
+batch_size = min(int(os.environ.get('INPUT_BATCH_SIZE') or 50), 100)
+
+# Number of status updates or comments sent per batched mutation
+mutation_batch_size = int(os.environ.get('INPUT_MUTATION_BATCH_SIZE') or 20)
+
+# Directory for caches and checkpoints persisted between runs
+state_dir = os.environ.get('INPUT_STATE_DIR') or os.path.join(
+    os.path.expanduser('~'), '.cache', 'qatesting_merged_dev_pr'
+)
+# Seconds before cached project, field and option IDs are fetched again
+metadata_cache_ttl = int(os.environ.get('INPUT_METADATA_CACHE_TTL') or 86400)
+
+# Incremental mode: only look at items updated since the previous run
+incremental = True if os.environ.get('INPUT_INCREMENTAL') == 'True' else False
+# Minutes between full scans while in incremental mode
+full_scan_interval = int(os.environ.get('INPUT_FULL_SCAN_INTERVAL') or 60)
+# Seconds the incremental window overlaps the previous run
+incremental_overlap = int(os.environ.get('INPUT_INCREMENTAL_OVERLAP') or 120)
+
+# How issues are discovered: "issues" walks the project, "pull_requests" starts
+# from the PRs merged into dev since the previous run
+discovery_mode = os.environ.get('INPUT_DISCOVERY_MODE') or 'issues'
+# Minutes of merged PRs to look at when there is no checkpoint yet
+pull_request_lookback = int(os.environ.get('INPUT_PULL_REQUEST_LOOKBACK') or 1440)
+
+# Event that triggered the workflow, used to handle a single merged PR
+event_name = os.environ.get('GITHUB_EVENT_NAME', '')
+event_path = os.environ.get('GITHUB_EVENT_PATH')
+
+# "once" runs a single pass, "daemon" keeps running and serves webhooks
+run_mode = os.environ.get('INPUT_RUN_MODE') or 'once'
+daemon_host = os.environ.get('INPUT_DAEMON_HOST') or '127.0.0.1'
+daemon_port = int(os.environ.get('INPUT_DAEMON_PORT') or 8080)
+webhook_secret = os.environ.get('INPUT_WEBHOOK_SECRET') or ''
+# Seconds without new merges before a burst is processed, and the longest a merge waits
+debounce_seconds = float(os.environ.get('INPUT_DEBOUNCE_SECONDS') or 10)
+debounce_max_seconds = float(os.environ.get('INPUT_DEBOUNCE_MAX_SECONDS') or 60)
+# Seconds between full scans in daemon mode, 0 to only rely on webhooks
+poll_interval = int(os.environ.get('INPUT_POLL_INTERVAL') or 0)
+
+# Batched reads in flight at the same time (keep at or below http_pool_size)
+concurrency = int(os.environ.get('INPUT_CONCURRENCY') or 4)
+# Batched mutations in flight at the same time; GitHub advises against concurrent writes
+mutation_concurrency = int(os.environ.get('INPUT_MUTATION_CONCURRENCY') or 1)
+
+# Rate limit points kept in reserve; below this the run waits for the reset
+rate_limit_reserve = int(os.environ.get('INPUT_RATE_LIMIT_RESERVE') or 50)
+# Longest single wait for a rate limit, in seconds
+rate_limit_max_wait = int(os.environ.get('INPUT_RATE_LIMIT_MAX_WAIT') or 900)
+# Largest page size of paginated queries, and the response time and rate limit
+# point cost per page that pages are sized towards (0 leaves the cost out)
+page_size = min(int(os.environ.get('INPUT_PAGE_SIZE') or 100), 100)
+page_target_seconds = float(os.environ.get('INPUT_PAGE_TARGET_SECONDS') or 5)
+page_target_cost = int(os.environ.get('INPUT_PAGE_TARGET_COST') or 10)
+
+# Fetch the newest linking events and comments of every issue along with the
+# project items, so most issues need no follow-up requests
+deep_snapshot = True if os.environ.get('INPUT_DEEP_SNAPSHOT') == 'True' else False
+
+# 'live' talks to the API, 'record' also saves every request and response to
+# cassette_path, 'replay' answers requests from that file without network access
+transport_mode = os.environ.get('INPUT_TRANSPORT_MODE') or 'live'
+cassette_path = os.environ.get('INPUT_CASSETTE_PATH') or 'graphql_cassette.json'
+
+# Where to write the run's metrics as JSON and as a Prometheus textfile, empty to skip
+metrics_path = os.environ.get('INPUT_METRICS_PATH') or ''
+metrics_textfile = os.environ.get('INPUT_METRICS_TEXTFILE') or ''
+
+# Split the project across shard_count parallel runs; this run handles the issues
+# whose id hashes to shard_index (0-based)
+shard_index = int(os.environ.get('INPUT_SHARD_INDEX') or 0)
+shard_count = max(int(os.environ.get('INPUT_SHARD_COUNT') or 1), 1)
+# Lease claimed on each (issue, PR) before commenting so overlapping runs never
+# both post: 'none', 'file' (in lease_dir, shared by the runs) or 'module:Class'
+lease_backend = os.environ.get('INPUT_LEASE_BACKEND') or 'none'
+lease_dir = os.environ.get('INPUT_LEASE_DIR') or os.path.join(state_dir, 'leases')
+# Seconds a lease is held; keep it well above the duration of a run
+lease_ttl = int(os.environ.get('INPUT_LEASE_TTL') or 900)
+
+# Seconds a scan may take, 0 for no limit. Recently updated issues are handled
+# first and the full scan continues where the previous run stopped
+run_budget = int(os.environ.get('INPUT_RUN_BUDGET') or 0)
+# Hold a lock in lease_dir while scanning, so an overlapping run exits right away;
+# a lock older than run_lock_ttl seconds is taken over
+run_lock = True if os.environ.get('INPUT_RUN_LOCK') == 'True' else False
+run_lock_ttl = int(os.environ.get('INPUT_RUN_LOCK_TTL') or 900)
+
+# Let the server filter the project items (open issues, repository_only,
+# exclude_statuses) instead of downloading them all
+server_side_filter = False if os.environ.get('INPUT_SERVER_SIDE_FILTER') == 'False' else True
+# Only look at the issues of this repository, not every repository on the board
+repository_only = True if os.environ.get('INPUT_REPOSITORY_ONLY') == 'True' else False
+# Comma separated status options whose issues are never touched, e.g. "Done,Released"
+exclude_statuses = [
+    status.strip()
+    for status in (os.environ.get('INPUT_EXCLUDE_STATUSES') or '').split(',')
+    if status.strip()
+]
+
+# Several repositories and projects handled by one process, as a JSON list of
+# objects with the keys repository ("owner/name"), repository_owner_type,
+# project_number, project_title, status_field_name and enterprise_github; the
+# inputs above are the defaults of the keys left out (see targets.py)
+projects = json.loads(os.environ.get('INPUT_PROJECTS') or '[]')
+
+# SQLite file mirroring the project items, linked PRs and QA comments between
+# runs, empty to go without (see store.py)
+store_path = os.environ.get('INPUT_STORE_PATH') or ''
@@ -0,0 +1,171 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import hmac
+import ipaddress
+import json
+import threading
+import time
+from logger import logger
+import logging
+import config
+import main
+from events import get_closed_pull_request
+from metrics import report_metrics
+
+"""
+Resident service mode: keeps the transport and caches warm between runs,
+accepts pull_request webhook deliveries and optionally polls on an interval.
+"""
+
+
+class Debouncer:
+    """
+    Collects merged PRs and hands them over in one batch once no new PR has
+    arrived for `delay` seconds (or `max_delay` seconds after the first one),
+    so a burst of merges touching the same issue is handled once.
+    """
+
+    def __init__(self, handler, delay, max_delay):
+        self.handler = handler
+        self.delay = delay
+        self.max_delay = max_delay
+        self._pending = {}
+        self._first_at = None
+        self._last_at = None
+        self._condition = threading.Condition()
+
+    def add(self, pull_request):
+        with self._condition:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_at = now
+            self._last_at = now
+            # Numbers are only unique within a repository
+            key = (main.pull_request_repository(pull_request), pull_request.get("number"))
+            self._pending[key] = pull_request
+            self._condition.notify()
+
+    def run(self, stop_event):
+        while not stop_event.is_set():
+            with self._condition:
+                if not self._pending:
+                    self._condition.wait(timeout=1)
+                    continue
+                now = time.monotonic()
+                due = min(self._last_at + self.delay, self._first_at + self.max_delay)
+                if now < due:
+                    self._condition.wait(timeout=due - now)
+                    continue
+                batch = list(self._pending.values())
+                self._pending = {}
+            self.handler(batch)
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    debouncer = None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if not self._verify_signature(body):
+            self._respond(401, "invalid signature")
+            return
+
+        event_name = self.headers.get("X-GitHub-Event", "")
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self._respond(400, "invalid JSON")
+            return
+
+        pull_request = get_closed_pull_request(event_name, payload)
+        if pull_request:
+            logger.info(f"Webhook: PR #{pull_request.get('number')} closed")
+            self.debouncer.add(pull_request)
+            self._respond(202, "queued")
+        else:
+            self._respond(200, "ignored")
+
+    def do_GET(self):
+        self._respond(200, "ok")
+
+    def _verify_signature(self, body):
+        if not config.webhook_secret:
+            return True
+        expected = "sha256=" + hmac.new(
+            config.webhook_secret.encode(), body, hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(expected, self.headers.get("X-Hub-Signature-256", ""))
+
+    def _respond(self, status, message):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.end_headers()
+        self.wfile.write(message.encode())
+
+    def log_message(self, format, *args):
+        logging.debug(f"Webhook {self.address_string()}: {format % args}")
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def run_daemon(stop_event=None):
+    """
+    Serves webhooks on config.daemon_host:config.daemon_port until interrupted.
+    All processing happens on a single worker thread, one batch at a time.
+    Without a webhook secret it only listens on a loopback address.
+    """
+    if not config.webhook_secret:
+        if not is_loopback(config.daemon_host):
+            # Unsigned deliveries would let anyone reaching the port trigger runs
+            logging.error(
+                f"Refusing to listen on {config.daemon_host} without INPUT_WEBHOOK_SECRET"
+            )
+            return
+        logging.warning("No INPUT_WEBHOOK_SECRET set, webhook deliveries are not verified")
+    stop_event = stop_event or threading.Event()
+    work_lock = threading.Lock()
+
+    def handle_pull_requests(pull_requests):
+        with work_lock:
+            try:
+                main.notify_merged_pull_requests(pull_requests)
+            except Exception:
+                logging.exception("Failed to process merged pull requests")
+            report_metrics()
+
+    debouncer = Debouncer(
+        handle_pull_requests, config.debounce_seconds, config.debounce_max_seconds
+    )
+    WebhookHandler.debouncer = debouncer
+    server = ThreadingHTTPServer((config.daemon_host, config.daemon_port), WebhookHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    threading.Thread(target=debouncer.run, args=(stop_event,), daemon=True).start()
+    logger.info(
+        f"Listening for webhooks on {config.daemon_host}:{server.server_address[1]}"
+    )
+
+    try:
+        while not stop_event.is_set():
+            if config.poll_interval:
+                with work_lock:
+                    try:
+                        main.notify_change_status()
+                    except Exception:
+                        logging.exception("Scheduled scan failed")
+                    report_metrics()
+                stop_event.wait(config.poll_interval)
+            else:
+                stop_event.wait(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        server.shutdown()
+        logger.info("Daemon stopped")
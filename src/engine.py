@@ -0,0 +1,27 @@
+import asyncio
+
+"""
+Bounded concurrency for independent network calls. The pooled transport is
+synchronous, so each call runs on a worker thread driven by an asyncio loop.
+"""
+
+
+async def _gather_bounded(func, items, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await asyncio.to_thread(func, item)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+def map_concurrently(func, items, concurrency):
+    """
+    Calls func on every item with at most `concurrency` calls in flight and
+    returns the results in the order of the items.
+    """
+    items = list(items)
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    return asyncio.run(_gather_bounded(func, items, concurrency))
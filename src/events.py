@@ -0,0 +1,34 @@
+import json
+import logging
+import config
+
+"""
+Reading the webhook payload of the event that triggered the workflow
+"""
+
+PULL_REQUEST_EVENTS = ("pull_request", "pull_request_target")
+
+
+def load_event_payload():
+    if not config.event_path:
+        return None
+    try:
+        with open(config.event_path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read event payload {config.event_path}: {e}")
+        return None
+
+
+def get_closed_pull_request(event_name=None, payload=None):
+    """
+    Returns the pull request from a `pull_request: closed` event, or None if
+    the run was triggered by anything else (schedule, workflow_dispatch, ...).
+    """
+    event_name = event_name if event_name is not None else config.event_name
+    if event_name not in PULL_REQUEST_EVENTS:
+        return None
+    payload = payload if payload is not None else load_event_payload()
+    if not payload or payload.get("action") != "closed":
+        return None
+    return payload.get("pull_request")
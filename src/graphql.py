@@ -1,253 +1,358 @@
-from pprint import pprint
 import logging
+import re
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 import config
+from metrics import get_metrics
+from transport import get_transport
+from cassette import operation_name
+import queries
+from batching import MutationOperation
+from ratelimit import page_sizer
+from models import (
+    ProjectItem,
+    decode_issue,
+    decode_json,
+    decode_linked_pr,
+    decode_project_item,
+)
 
 logging.basicConfig(level=logging.DEBUG)  # Ensure logging is set up
 
 
-def get_repo_issues(owner, repository, after=None, issues=None):
-    query = """
-    query GetRepoClosedIssues($owner: String!, $repo: String!, $after: String) {
-      repository(owner: $owner, name: $repo) {
-        issues(first: 100, after: $after, states: [OPEN]) {
-          nodes {
-            id
-            title
-            number
-            url
-            assignees(first:100) {
-              nodes {
-                name
-                email
-                login
-              }
-            }
-            projectItems(first: 10) {
-              nodes {
-                project {
-                  number
-                  title
-                }
-              }
-            }
-          }
-          pageInfo {
-            endCursor
-            hasNextPage
-          }
-        }
-      }
-    }
+class PaginationError(Exception):
+    """
+    Raised by a paginated iterator when a page couldn't be fetched, with the
+    GraphQL errors of the response if it had any.
+    """
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+class PagePosition:
     """
-    variables = {"owner": owner, "repo": repository, "after": after}
-    response = requests.post(
-        config.api_endpoint,
-        json={"query": query, "variables": variables},
-        headers={"Authorization": f"Bearer {config.gh_token}"},
+    Where a paginated walk is: `after` is the cursor the page currently being
+    yielded was fetched with, so resuming from it repeats at most one page.
+    """
+
+    def __init__(self, after=None):
+        self.after = after
+
+
+def iter_repo_issues(owner, repository, position=None):
+    """
+    Yields the open issues of the repository page by page, as models.Issue.
+    Raises PaginationError if a page couldn't be fetched.
+    """
+    query = queries.GET_REPO_ISSUES
+    variables = {"owner": owner, "repo": repository}
+    nodes = paginate(
+        "GetRepoOpenIssues", query, variables, ("repository", "issues"), position=position
     )
-    data = response.json()
-    if data.get("errors"):
-        print(data.get("errors"))
-    pprint(data)
-    repository_data = data.get("data", {}).get("repository", {})
-    issues_data = repository_data.get("issues", {})
-    pageinfo = issues_data.get("pageInfo", {})
-    nodes = issues_data.get("nodes", [])
-    if issues is None:
-        issues = []
-    issues = issues + nodes
-    if pageinfo.get("hasNextPage"):
-        return get_repo_issues(
-            owner, repository, after=pageinfo.get("endCursor"), issues=issues
+    return _decoded(nodes, decode_issue)
+
+
+def decode_data(response):
+    """
+    Decodes a GraphQL response body. A body with neither data nor errors
+    isn't an answer to the query and raises requests' InvalidJSONError.
+    """
+    data = decode_json(response)
+    if not isinstance(data, dict) or (data.get("data") is None and not data.get("errors")):
+        raise requests.exceptions.InvalidJSONError(
+            f"Response without data: {response.text[:200]}"
         )
-    return issues
+    return data
+
+
+def _decoded(nodes, decode):
+    """Maps decode over a paginated walk, closing the walk along with it."""
+    try:
+        for node in nodes:
+            yield decode(node)
+    finally:
+        nodes.close()
+
+
+def _post_page(query_name, sizer, query, variables):
+    """
+    Sends one page of a paginated query, feeding its response time and point
+    cost to the page sizer. Raises PaginationError on errors.
+    """
+    started = time.monotonic()
+    try:
+        data = _query(query, variables)
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"Request error: {e}")
+        sizer.shrink()
+        raise PaginationError(f"Failed to fetch a page of {query_name}") from e
+    if "errors" in data:
+        logging.error(f"GraphQL query errors: {data['errors']}")
+        sizer.shrink()
+        raise PaginationError(f"Failed to fetch a page of {query_name}", data["errors"])
+    rate_limit = data["data"].get("rateLimit") or {}
+    sizer.record(time.monotonic() - started, rate_limit.get("cost"))
+    return data
 
 
-def get_project_issues(
-    owner, owner_type, project_number, status_field_name, filters=None, after=None, issues=None
+def _query(query, variables, headers=None):
+    """
+    Sends a query and returns its decoded response, with the point cost and
+    remaining budget of its rateLimit selection recorded.
+    """
+    response = get_transport().post(query, variables, headers=headers)
+    data = decode_data(response)
+    _observe_rate_limit(operation_name(query), data)
+    return data
+
+
+def _observe_rate_limit(query_name, data):
+    """
+    Feeds the `rateLimit { cost remaining resetAt }` selection of a response
+    to the rate limiter and the metrics, and returns it.
+    """
+    rate_limit = (data.get("data") or {}).get("rateLimit") or {}
+    get_transport().rate_limiter.observe_cost(rate_limit)
+    if rate_limit:
+        get_metrics().observe_cost(query_name, rate_limit.get("cost"))
+    return rate_limit
+
+
+def paginate(
+    query_name,
+    query,
+    variables,
+    connection_path,
+    prefetch=True,
+    max_page_size=None,
+    position=None,
 ):
-    query = f"""
-    query GetProjectIssues($owner: String!, $projectNumber: Int!, $status: String!, $after: String) {{
-      {owner_type}(login: $owner) {{
-        projectV2(number: $projectNumber) {{
-          id
-          title
-          items(first: 100, after: $after) {{
-            nodes {{
-              id
-              fieldValueByName(name: $status) {{
-                ... on ProjectV2ItemFieldSingleSelectValue {{
-                  id
-                  name
-                }}
-              }}
-              content {{
-                ... on Issue {{
-                  id
-                  title
-                  number
-                  state
-                  url
-                }}
-              }}
-            }}
-            pageInfo {{
-              endCursor
-              hasNextPage
-            }}
-          }}
-        }}
-      }}
-    }}
     """
-    variables = {
-        "owner": owner,
-        "projectNumber": project_number,
-        "status": status_field_name,
-        "after": after,
-    }
+    Yields the nodes of a paginated connection lazily, one page at a time.
+
+    The query takes $first and $after; connection_path is the chain of keys
+    from "data" down to the connection. With prefetch, the next page is
+    requested in the background while the caller works on the current one,
+    so at most two pages are held in memory. A PagePosition starts the walk
+    at its cursor and follows it page by page.
+    Raises PaginationError if a page couldn't be fetched.
+    """
+    sizer = page_sizer(query_name, max_page_size)
+    position = position or PagePosition()
+
+    def fetch(after):
+        page_variables = dict(variables, first=sizer.size, after=after)
+        data = _post_page(query_name, sizer, query, page_variables)
+        connection = data.get("data") or {}
+        for key in connection_path:
+            connection = connection.get(key) or {}
+        return connection.get("nodes") or [], connection.get("pageInfo") or {}
+
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
     try:
-        response = requests.post(
-            config.api_endpoint,
-            json={"query": query, "variables": variables},
-            headers={"Authorization": f"Bearer {config.gh_token}"},
-        )
-        data = response.json()
-        if "errors" in data:
-            logging.error(f"GraphQL query errors: {data['errors']}")
-            return []
-        owner_data = data["data"].get(owner_type, {})
-        project_data = owner_data.get("projectV2", {})
-        items_data = project_data.get("items", {})
-        pageinfo = items_data.get("pageInfo", {})
-        nodes = items_data.get("nodes", [])
-        if issues is None:
-            issues = []
+        after = position.after
+        nodes, pageinfo = fetch(after)
+        while True:
+            position.after = after
+            next_page = None
+            if pageinfo.get("hasNextPage"):
+                after = pageinfo.get("endCursor")
+                if executor:
+                    next_page = executor.submit(fetch, after)
+                else:
+                    next_page = after
+            yield from nodes
+            if next_page is None:
+                return
+            if executor:
+                nodes, pageinfo = next_page.result()
+            else:
+                nodes, pageinfo = fetch(next_page)
+    finally:
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_filtered_project_items(items, filters=None):
+    """
+    Lazily applies the filters to a (possibly streamed) sequence of project items.
+    The updated_since filter is only applied by the server, callers compare
+    the items' timestamps themselves.
+    """
+    for item in items:
         if filters:
-            filtered = []
-            for node in nodes:
-                issue_content = node.get("content", {})
-                if not issue_content:
-                    continue
-                if filters.get("open_only") and issue_content.get("state") != "OPEN":
-                    continue
-                filtered.append(node)
-            nodes = filtered
-        issues = issues + nodes
-        if pageinfo.get("hasNextPage"):
-            return get_project_issues(
-                owner,
-                owner_type,
-                project_number,
-                status_field_name,
-                filters,
-                after=pageinfo.get("endCursor"),
-                issues=issues,
-            )
-        return issues
-    except requests.RequestException as e:
-        logging.error(f"Request error: {e}")
-        return []
+            if item.issue is None:
+                continue
+            if filters.get("open_only") and item.issue.state != "OPEN":
+                continue
+            if filters.get("repository") and item.issue.repository != filters["repository"]:
+                continue
+            if item.status in (filters.get("exclude_statuses") or ()):
+                continue
+        yield item
+
+
+def project_items_filter(filters, status_field_name):
+    """
+    Renders the filters in the project filter syntax taken by the
+    `items(query:)` argument, or None if there's nothing to filter on.
+
+    Supported filters: open_only, issues_only, repository ("owner/name"),
+    exclude_statuses (option names) and updated_since (a timestamp, rounded
+    down to its day).
+    """
+    if not filters:
+        return None
+    terms = []
+    if filters.get("open_only"):
+        terms.append("is:open")
+    if filters.get("issues_only"):
+        terms.append("is:issue")
+    if filters.get("repository"):
+        terms.append(f"repo:{filters['repository']}")
+    field = status_field_name.lower().replace(" ", "-")
+    for status in filters.get("exclude_statuses") or ():
+        terms.append(f'-{field}:"{status}"')
+    if filters.get("updated_since"):
+        terms.append(f"updated:>={filters['updated_since'][:10]}")
+    return " ".join(terms) or None
+
+
+def get_project_snapshot(
+    owner, owner_type, project_number, status_field_name, filters=None
+):
+    """
+    Pages the project once and returns an index from issue node id to its
+    project item, or None if the project couldn't be fetched.
+    """
+    items = get_project_items(
+        owner, owner_type, project_number, status_field_name, filters
+    )
+    if items is None:
+        return None
+    return {item.issue.id: item for item in items if item.issue}
 
 
 def get_project_items(
-    owner, owner_type, project_number, status_field_name, filters=None, after=None, items=None
+    owner, owner_type, project_number, status_field_name, filters=None
 ):
-    query = f"""
-    query GetProjectItems($owner: String!, $projectNumber: Int!, $status: String!, $after: String) {{
-      {owner_type}(login: $owner) {{
-        projectV2(number: $projectNumber) {{
-          id
-          title
-          items(first: 100, after: $after) {{
-            nodes {{
-              id
-              fieldValueByName(name: $status) {{
-                ... on ProjectV2ItemFieldSingleSelectValue {{
-                  id
-                  name
-                }}
-              }}
-              content {{
-                ... on Issue {{
-                  id
-                  title
-                  state
-                  url
-                }}
-              }}
-            }}
-            pageInfo {{
-              endCursor
-              hasNextPage
-            }}
-          }}
-        }}
-      }}
-    }}
     """
+    Returns every item of the project (matching the filters, where the server
+    applies them), or None if they couldn't be fetched.
+    """
+    try:
+        return list(
+            iter_project_items(
+                owner, owner_type, project_number, status_field_name, filters=filters
+            )
+        )
+    except PaginationError:
+        return None
+
+
+# Cleared when the server doesn't know the items(query:) argument (older GitHub
+# Enterprise Server releases), so the rest of the process doesn't retry it
+_items_filter_supported = True
+
+
+def is_filter_rejected(errors):
+    """
+    True if the GraphQL errors say the items(query:) argument isn't part of
+    the schema, as opposed to a failure that may not happen again.
+    """
+    for error in errors:
+        if (error.get("extensions") or {}).get("argumentName") == "query":
+            return True
+        message = error.get("message", "")
+        if "argument 'query'" in message or "$query" in message:
+            return True
+    return False
+
+
+def iter_project_items(
+    owner,
+    owner_type,
+    project_number,
+    status_field_name,
+    deep=False,
+    position=None,
+    filters=None,
+):
+    """
+    Yields the items of the project page by page, as models.ProjectItem.
+
+    With deep, every issue also carries the newest few linking timeline events
+    and comments (see queries.DEEP_ISSUE_FIELDS), in smaller pages, reduced to the
+    latest dev PR and the comments by decode_deep_snapshot. With
+    config.server_side_filter, the filters (see project_items_filter) are
+    sent along so the server leaves out the items they exclude; callers still
+    apply iter_filtered_project_items in case it couldn't.
+    Raises PaginationError if a page couldn't be fetched.
+    """
+    items_filter = None
+    if config.server_side_filter and _items_filter_supported:
+        items_filter = project_items_filter(filters, status_field_name)
+    nodes = _paginate_project_items(
+        owner, owner_type, project_number, status_field_name, deep, position, items_filter
+    )
+    if items_filter is not None:
+        nodes = _with_filter_fallback(
+            nodes,
+            lambda: _paginate_project_items(
+                owner, owner_type, project_number, status_field_name, deep, position, None
+            ),
+        )
+    snapshot_decoder = decode_deep_snapshot if deep else None
+    return _decoded(nodes, lambda node: decode_project_item(node, snapshot_decoder))
+
+
+def _with_filter_fallback(filtered, unfiltered):
+    global _items_filter_supported
+    started = False
+    try:
+        for node in filtered:
+            started = True
+            yield node
+    except PaginationError as e:
+        if started or not is_filter_rejected(e.errors):
+            raise
+        logging.warning(
+            "The project items query filter was rejected, filtering the items locally instead"
+        )
+        _items_filter_supported = False
+        yield from unfiltered()
+
+
+def _paginate_project_items(
+    owner, owner_type, project_number, status_field_name, deep, position, items_filter
+):
+    query_name = "GetProjectItemsDeep" if deep else "GetProjectItems"
+    query = queries.project_items(owner_type, deep, filtered=bool(items_filter))
     variables = {
         "owner": owner,
         "projectNumber": project_number,
         "status": status_field_name,
-        "after": after,
     }
-    try:
-        response = requests.post(
-            config.api_endpoint,
-            json={"query": query, "variables": variables},
-            headers={"Authorization": f"Bearer {config.gh_token}"},
-        )
-        data = response.json()
-        if "errors" in data:
-            logging.error(f"GraphQL query errors: {data['errors']}")
-            return []
-        owner_data = data["data"].get(owner_type, {})
-        project_data = owner_data.get("projectV2", {})
-        items_data = project_data.get("items", {})
-        pageinfo = items_data.get("pageInfo", {})
-        nodes = items_data.get("nodes", [])
-        if items is None:
-            items = []
-        items += nodes
-        if pageinfo.get("hasNextPage"):
-            return get_project_items(
-                owner,
-                owner_type,
-                project_number,
-                status_field_name,
-                filters,
-                after=pageinfo.get("endCursor"),
-                items=items,
-            )
-        return items
-    except requests.RequestException as e:
-        logging.error(f"Request error: {e}")
-        return []
+    if items_filter:
+        variables["query"] = items_filter
+    return paginate(
+        query_name,
+        query,
+        variables,
+        (owner_type, "projectV2", "items"),
+        max_page_size=DEEP_PAGE_SIZE if deep else None,
+        position=position,
+    )
 
 
 def get_project_id_by_title(owner, project_title):
-    query = """
-    query($owner: String!, $projectTitle: String!) {
-      organization(login: $owner) {
-        projectsV2(first: 10, query: $projectTitle) {
-          nodes {
-            id
-            title
-          }
-        }
-      }
-    }
-    """
+    query = queries.GET_PROJECT_BY_TITLE
     variables = {"owner": owner, "projectTitle": project_title}
     try:
-        response = requests.post(
-            config.api_endpoint,
-            json={"query": query, "variables": variables},
-            headers={"Authorization": f"Bearer {config.gh_token}"},
-        )
-        data = response.json()
+        data = _query(query, variables)
         if "errors" in data:
             logging.error(f"GraphQL query errors: {data['errors']}")
             return None
@@ -261,287 +366,554 @@ def get_project_id_by_title(owner, project_title):
         return None
 
 
-def get_status_field_id(project_id, status_field_name):
-    query = """
-    query($projectId: ID!) {
-      node(id: $projectId) {
-        ... on ProjectV2 {
-          fields(first: 100) {
-            nodes {
-              __typename
-              ... on ProjectV2SingleSelectField {
-                id
-                name
-                options {
-                  id
-                  name
-                }}
-            }
-          }
-        }
-      }
-    }
+def get_project_fields(project_id):
+    """
+    Returns the project's fields (with options for single-select fields),
+    or None on error.
     """
+    query = queries.GET_PROJECT_FIELDS
     variables = {"projectId": project_id}
     try:
-        response = requests.post(
-            config.api_endpoint,
-            json={"query": query, "variables": variables},
-            headers={"Authorization": f"Bearer {config.gh_token}"},
-        )
-        data = response.json()
+        data = _query(query, variables)
         if "errors" in data:
             logging.error(f"GraphQL query errors: {data['errors']}")
             return None
-        fields = data["data"]["node"]["fields"]["nodes"]
-        for field in fields:
-            if (
-                field.get("name") == status_field_name
-                and field["__typename"] == "ProjectV2SingleSelectField"
-            ):
-                return field["id"]
-        return None
+        return data["data"]["node"]["fields"]["nodes"]
     except requests.RequestException as e:
         logging.error(f"Request error: {e}")
         return None
 
 
-def get_qatesting_status_option_id(project_id, status_field_name):
-    query = """
-    query($projectId: ID!) {
-      node(id: $projectId) {
-        ... on ProjectV2 {
-          fields(first: 100) {
-            nodes {
-              __typename
-              ... on ProjectV2SingleSelectField {
-                id
-                name
-                options {
-                  id
-                  name
-                }}
-            }
-          }
-        }
-      }
-    }
+def find_status_field(fields, status_field_name):
+    for field in fields or []:
+        if (
+            field.get("name") == status_field_name
+            and field["__typename"] == "ProjectV2SingleSelectField"
+        ):
+            return field
+    return None
+
+
+# Timeline events per page, newest first
+TIMELINE_PAGE_SIZE = 25
+
+
+def _latest_dev_pr(timeline_nodes, latest_pr=None):
     """
-    variables = {"projectId": project_id}
-    try:
-        response = requests.post(
-            config.api_endpoint,
-            json={"query": query, "variables": variables},
-            headers={"Authorization": f"Bearer {config.gh_token}"},
-        )
-        data = response.json()
-        if "errors" in data:
-            logging.error(f"GraphQL query errors: {data['errors']}")
-            return None
-        fields = data["data"]["node"]["fields"]["nodes"]
-        for field in fields:
+    Returns the newest PR merged into dev among the given timeline nodes.
+    """
+    for item in timeline_nodes:
+        if item.get("__typename") == "CrossReferencedEvent":
+            prs = [item.get("source")]
+        elif item.get("__typename") == "ConnectedEvent":
+            prs = [item.get("source"), item.get("subject")]
+        else:
+            continue
+        for pr in prs:
             if (
-                field.get("name") == status_field_name
-                and field["__typename"] == "ProjectV2SingleSelectField"
+                isinstance(pr, dict)
+                and pr.get("mergedAt")
+                and pr.get("baseRefName") == "dev"
             ):
-                for option in field.get("options", []):
-                    if option["name"] == "QA Testing":
-                        return option["id"]
-        return None
-    except requests.RequestException as e:
-        logging.error(f"Request error: {e}")
-        return None
+                if latest_pr is None or pr["mergedAt"] > latest_pr.merged_at:
+                    latest_pr = decode_linked_pr(pr)
+    return latest_pr
 
 
-def get_latest_merged_pr_into_dev(issue_id: str):
+def get_latest_merged_pr_into_dev(issue_id: str, before=None, since=None):
     """
     Returns the latest merged PR into dev for the given issue, or None if none exist.
+
+    Only cross-reference and connected events are requested, starting from the
+    newest end of the timeline, and the scan stops at the first page that
+    references a merged dev PR. `since` optionally bounds how far back it looks.
     """
-    query = """
-    query GetIssueTimeline($issueId: ID!, $afterCursor: String) {
-      node(id: $issueId) {
-        ... on Issue {
-          timelineItems(first: 100, after: $afterCursor) {
-            nodes {
-              __typename
-              ... on CrossReferencedEvent {
-                source {
-                  ... on PullRequest {
-                    id
-                    number
-                    mergedAt
-                    url
-                    baseRefName
-                    headRefName
-                  }
-                }
-              }
-            }
-            pageInfo {
-              endCursor
-              hasNextPage
-            }
-          }
-        }
-      }
+    query = queries.GET_ISSUE_TIMELINE
+    variables = {
+        "issueId": issue_id,
+        "last": TIMELINE_PAGE_SIZE,
+        "before": before,
+        "since": since,
     }
-    """
-    variables = {"issueId": issue_id, "afterCursor": None}
-    latest_pr = None
     try:
         while True:
-            response = requests.post(
-                config.api_endpoint,
-                json={"query": query, "variables": variables},
-                headers={
-                    "Authorization": f"Bearer {config.gh_token}",
-                    "Accept": "application/vnd.github.v4+json",
-                },
+            data = _query(
+                query,
+                variables,
+                headers={"Accept": "application/vnd.github.v4+json"},
             )
-            data = response.json()
             if "errors" in data:
                 logging.error(f"GraphQL query errors: {data['errors']}")
                 return None
 
             timeline = data.get("data", {}).get("node", {}).get("timelineItems", {})
-            nodes = timeline.get("nodes", [])
-            for item in nodes:
-                if item.get("__typename") == "CrossReferencedEvent":
-                    pr = item.get("source")
-                    if (
-                        isinstance(pr, dict)
-                        and pr.get("mergedAt")
-                        and pr.get("baseRefName") == "dev"
-                    ):
-                        if latest_pr is None or pr["mergedAt"] > latest_pr["mergedAt"]:
-                            latest_pr = {
-                                "number": pr["number"],
-                                "url": pr["url"],
-                                "mergedAt": pr["mergedAt"],
-                            }
+            latest_pr = _latest_dev_pr(timeline.get("nodes", []))
+            if latest_pr:
+                return latest_pr
 
             page = timeline.get("pageInfo", {})
-            if not page.get("hasNextPage"):
-                break
-            variables["afterCursor"] = page.get("endCursor")
-
-        return latest_pr
+            if not page.get("hasPreviousPage"):
+                return None
+            variables["before"] = page.get("startCursor")
     except requests.RequestException as e:
         logging.error(f"Request error: {e}")
         return None
 
 
-def update_issue_status_to_qa_testing(
-    owner, project_title, project_id, status_field_id, item_id, status_option_id
-):
-    mutation = """
-    mutation UpdateIssueStatus($projectId: ID!, $itemId: ID!, $statusFieldId: ID!, $statusOptionId: String!) {
-      updateProjectV2ItemFieldValue(input: {
-        projectId: $projectId,
-        itemId: $itemId,
-        fieldId: $statusFieldId,
-        value: { singleSelectOptionId: $statusOptionId }
-      }) {
-        projectV2Item { id }
-      }
-    }
+# Deep project snapshot items are bigger, so pages are smaller
+DEEP_PAGE_SIZE = 50
+
+
+def decode_deep_snapshot(issue, content):
     """
-    variables = {
-        "projectId": project_id,
-        "itemId": item_id,
-        "statusFieldId": status_field_id,
-        "statusOptionId": status_option_id,
-    }
-    try:
-        response = requests.post(
-            config.api_endpoint,
-            json={"query": mutation, "variables": variables},
-            headers={"Authorization": f"Bearer {config.gh_token}"},
+    Keeps what the nested fields of a deep snapshot tell about the issue: its
+    latest dev PR, whether no dev PR was found among the nested events but
+    older ones exist (timeline_truncated), the nested comments, and the
+    timestamp from which they're known to be complete (None if they're all there).
+    """
+    timeline = content.get("timelineItems") or {}
+    issue.latest_pr = _latest_dev_pr(timeline.get("nodes", []))
+    issue.timeline_truncated = not issue.latest_pr and bool(
+        (timeline.get("pageInfo") or {}).get("hasPreviousPage")
+    )
+    comments_data = content.get("comments") or {}
+    issue.comments = comments_data.get("nodes", [])
+    issue.comments_complete_since = None
+    if (comments_data.get("pageInfo") or {}).get("hasPreviousPage"):
+        issue.comments_complete_since = (
+            issue.comments[0]["createdAt"] if issue.comments else ""
         )
-        data = response.json()
+
+
+def comments_from_snapshot(issue, author_login):
+    """
+    Returns (comments, complete_since) for an issue of a deep snapshot: the
+    nested comments written by author_login, and the timestamp from which
+    that list is known to be complete (None if it holds every comment).
+    """
+    comments = [
+        comment
+        for comment in issue.comments or ()
+        if (comment.get("author") or {}).get("login") == author_login
+    ]
+    return comments, issue.comments_complete_since
+
+
+def get_viewer_login():
+    """
+    Returns the login of the user the token belongs to, or None on error.
+    """
+    query = queries.GET_VIEWER
+    try:
+        data = _query(query, {})
         if "errors" in data:
-            logging.error(f"GraphQL mutation errors: {data['errors']}")
+            logging.error(f"GraphQL query errors: {data['errors']}")
             return None
-        return data.get("data")
+        return data["data"]["viewer"]["login"]
     except requests.RequestException as e:
         logging.error(f"Request error: {e}")
         return None
 
 
-def get_issue_comments(issue_id):
-    query = """
-    query GetIssueComments($issueId: ID!, $afterCursor: String) {
-      node(id: $issueId) {
-        ... on Issue {
-          comments(first: 100, after: $afterCursor) {
-            nodes {
-              body
-              createdAt
-              author { login }
-            }
-            pageInfo {
-              endCursor
-              hasNextPage
-            }
-          }
-        }
-      }
-    }
+def get_latest_merged_prs_into_dev(issue_ids, since=None):
+    """
+    Batched get_latest_merged_pr_into_dev: resolves many issues with a single
+    nodes(ids: [...]) query over the newest end of their timelines. Issues
+    with older events left and no dev PR found yet keep scanning backwards
+    individually from where the batch stopped.
     """
-    variables = {"issueId": issue_id, "afterCursor": None}
-    all_comments = []
+    query = queries.GET_ISSUES_TIMELINES
+    variables = {"ids": list(issue_ids), "last": TIMELINE_PAGE_SIZE, "since": since}
+    results = {}
     try:
-        while True:
-            response = requests.post(
-                config.api_endpoint,
-                json={"query": query, "variables": variables},
-                headers={"Authorization": f"Bearer {config.gh_token}"},
+        data = _query(
+            query,
+            variables,
+            headers={"Accept": "application/vnd.github.v4+json"},
+        )
+        if "errors" in data:
+            logging.error(f"GraphQL query errors: {data['errors']}")
+        nodes = (data.get("data") or {}).get("nodes") or []
+    except requests.RequestException as e:
+        logging.error(f"Request error: {e}")
+        nodes = []
+
+    for node in nodes:
+        if not node or not node.get("id"):
+            continue
+        timeline = node.get("timelineItems") or {}
+        latest_pr = _latest_dev_pr(timeline.get("nodes", []))
+        page = timeline.get("pageInfo", {})
+        if not latest_pr and page.get("hasPreviousPage"):
+            latest_pr = get_latest_merged_pr_into_dev(
+                node["id"], before=page.get("startCursor"), since=since
             )
-            data = response.json()
+        results[node["id"]] = latest_pr
+
+    # Anything the batch could not resolve is retried on its own
+    for issue_id in issue_ids:
+        if issue_id not in results:
+            results[issue_id] = get_latest_merged_pr_into_dev(issue_id, since=since)
+    return results
+
+
+COMMENTS_PAGE_SIZE = 20
+
+
+def _comments_since(comments_data, since):
+    """
+    Returns the comments created after `since` and whether older ones may be left.
+    """
+    comments = []
+    reached_since = False
+    for comment in reversed(comments_data.get("nodes", [])):
+        if since and comment.get("createdAt", "") < since:
+            reached_since = True
+            break
+        comments.append(comment)
+    page = comments_data.get("pageInfo", {})
+    return comments, not reached_since and page.get("hasPreviousPage"), page.get("startCursor")
+
+
+def get_issue_comments_since(issue_id, since=None, before=None, comments=None):
+    """
+    Returns the issue's comments created after `since`, newest first, only
+    paging as far back as needed.
+    """
+    query = queries.GET_ISSUE_COMMENTS_SINCE
+    variables = {"issueId": issue_id, "last": COMMENTS_PAGE_SIZE, "before": before}
+    all_comments = list(comments or [])
+    try:
+        while True:
+            data = _query(query, variables)
             if "errors" in data:
                 logging.error(f"GraphQL query errors: {data['errors']}")
-                break
+                return None
             comments_data = data.get("data", {}).get("node", {}).get("comments", {})
-            nodes = comments_data.get("nodes", [])
-            all_comments.extend(nodes)
-            page = comments_data.get("pageInfo", {})
-            if not page.get("hasNextPage"):
-                break
-            variables["afterCursor"] = page.get("endCursor")
-        return all_comments
+            page_comments, has_more, cursor = _comments_since(comments_data, since)
+            all_comments.extend(page_comments)
+            if not has_more:
+                return all_comments
+            variables["before"] = cursor
     except requests.RequestException as e:
         logging.error(f"Request error: {e}")
-        return []
+        return None
 
 
-def add_issue_comment(issue_id, body: str):
+def get_issues_comments_since(keys):
     """
-    Adds a comment to the given issue.
+    Batched get_issue_comments_since for (issue_id, since) keys: the newest
+    comments of many issues come back from a single nodes(ids: [...]) query,
+    and only issues with more comments after `since` page further back.
+    Issues whose comments couldn't be fetched map to None.
     """
-    mutation = """
-    mutation AddComment($subjectId: ID!, $body: String!) {
-      addComment(input: {subjectId: $subjectId, body: $body}) {
+    query = queries.GET_ISSUES_COMMENTS_SINCE
+    since_by_id = dict(keys)
+    variables = {"ids": list(since_by_id), "last": COMMENTS_PAGE_SIZE}
+    comments_by_id = {}
+    try:
+        data = _query(query, variables)
+        if "errors" in data:
+            logging.error(f"GraphQL query errors: {data['errors']}")
+        nodes = (data.get("data") or {}).get("nodes") or []
+    except requests.RequestException as e:
+        logging.error(f"Request error: {e}")
+        nodes = []
+
+    for node in nodes:
+        if not node or node.get("id") not in since_by_id:
+            continue
+        issue_id = node["id"]
+        since = since_by_id[issue_id]
+        comments, has_more, cursor = _comments_since(node.get("comments") or {}, since)
+        if has_more:
+            comments = get_issue_comments_since(
+                issue_id, since=since, before=cursor, comments=comments
+            )
+        comments_by_id[issue_id] = comments
+
+    results = {}
+    for key in keys:
+        issue_id, since = key
+        if issue_id not in comments_by_id:
+            comments_by_id[issue_id] = get_issue_comments_since(issue_id, since=since)
+        results[key] = comments_by_id[issue_id]
+    return results
+
+
+def status_update_operation(project_id, status_field_id, item_id, status_option_id):
+    """
+    The updateProjectV2ItemFieldValue mutation as a batchable operation.
+    """
+    return MutationOperation(
+        field="""updateProjectV2ItemFieldValue(input: {
+        projectId: $projectId,
+        itemId: $itemId,
+        fieldId: $statusFieldId,
+        value: { singleSelectOptionId: $statusOptionId }
+      }) {
+        projectV2Item { id }
+      }""",
+        variable_types={
+            "projectId": "ID!",
+            "itemId": "ID!",
+            "statusFieldId": "ID!",
+            "statusOptionId": "String!",
+        },
+        variables={
+            "projectId": project_id,
+            "itemId": item_id,
+            "statusFieldId": status_field_id,
+            "statusOptionId": status_option_id,
+        },
+    )
+
+
+def add_comment_operation(issue_id, body: str):
+    """
+    The addComment mutation as a batchable operation.
+    """
+    return MutationOperation(
+        field="""addComment(input: {subjectId: $subjectId, body: $body}) {
         commentEdge {
           node {
             id
-            body
           }
         }
-      }
+      }""",
+        variable_types={"subjectId": "ID!", "body": "String!"},
+        variables={"subjectId": issue_id, "body": body},
+    )
+
+
+# Rate limit points of a mutation request, GitHub's minimum for any call
+MUTATION_COST = 1
+
+
+def send_mutation(mutation, variables):
+    """
+    Sends a (batched) mutation document and returns the decoded response,
+    errors included, so callers can attribute them per alias.
+    """
+    try:
+        response = get_transport().post(mutation, variables, idempotent=False)
+        # Mutations can't select rateLimit, each request is counted at the minimum cost
+        get_metrics().observe_cost(operation_name(mutation), MUTATION_COST)
+        return decode_data(response)
+    except (requests.RequestException, ValueError) as e:
+        logging.error(f"Request error: {e}")
+        return None
+
+
+ISSUE_REFERENCE_PATTERN = re.compile(r"(?<![\w/])#(\d+)\b")
+
+
+def get_merged_dev_pull_requests(owner, repository, status_field_name, since=None):
+    """
+    Returns the pull requests merged into dev whose updatedAt is after `since`,
+    newest first, each with the issues it closes or mentions ("issues"), or
+    None if some of them couldn't be fetched.
+    """
+    query = queries.GET_MERGED_DEV_PULL_REQUESTS
+    variables = {
+        "owner": owner,
+        "repo": repository,
+        "status": status_field_name,
+        "after": None,
     }
+    pull_requests = []
+    try:
+        while True:
+            data = _query(query, variables)
+            if "errors" in data:
+                logging.error(f"GraphQL query errors: {data['errors']}")
+                return None
+            repository_data = (data.get("data") or {}).get("repository")
+            if repository_data is None:
+                logging.error(f"Repository {owner}/{repository} not found")
+                return None
+            connection = repository_data.get("pullRequests") or {}
+            reached_since = False
+            for pr in connection.get("nodes", []):
+                if since and pr["updatedAt"] <= since:
+                    reached_since = True
+                    break
+                pull_requests.append(pr)
+            page = connection.get("pageInfo", {})
+            if reached_since or not page.get("hasNextPage"):
+                break
+            variables["after"] = page.get("endCursor")
+    except requests.RequestException as e:
+        logging.error(f"Request error: {e}")
+        return None
+
+    if not _attach_linked_issues(owner, repository, status_field_name, pull_requests):
+        return None
+    return pull_requests
+
+
+def get_pull_request(owner, repository, number, status_field_name):
+    """
+    Returns a single pull request with the issues it closes or mentions
+    ("issues"), or None if it couldn't be fetched.
     """
-    variables = {"subjectId": issue_id, "body": body}
+    query = queries.GET_PULL_REQUEST
+    variables = {
+        "owner": owner,
+        "repo": repository,
+        "number": number,
+        "status": status_field_name,
+    }
     try:
-        response = requests.post(
-            config.api_endpoint,
-            json={"query": mutation, "variables": variables},
-            headers={"Authorization": f"Bearer {config.gh_token}"},
-        )
-        data = response.json()
+        data = _query(query, variables)
         if "errors" in data:
-            logging.error(f"GraphQL mutation errors: {data['errors']}")
+            logging.error(f"GraphQL query errors: {data['errors']}")
+            return None
+        repository_data = (data.get("data") or {}).get("repository")
+        if repository_data is None:
+            logging.error(f"Repository {owner}/{repository} not found")
             return None
-        return data.get("data")
+        pr = repository_data.get("pullRequest")
     except requests.RequestException as e:
         logging.error(f"Request error: {e}")
         return None
+
+    if not pr or not _attach_linked_issues(owner, repository, status_field_name, [pr]):
+        return None
+    return pr
+
+
+def _attach_linked_issues(owner, repository, status_field_name, pull_requests):
+    """
+    Sets pr["issues"] to the issues each PR closes plus the ones its title or
+    body mention as #123, resolving the mentioned numbers in one query.
+    Returns False if some of them couldn't be fetched.
+    """
+    mentioned = set()
+    for pr in pull_requests:
+        text = f"{pr.get('title') or ''}\n{pr.get('body') or ''}"
+        pr["mentions"] = {int(n) for n in ISSUE_REFERENCE_PATTERN.findall(text)}
+        mentioned |= pr["mentions"]
+
+    issues_by_number = get_issues_by_number(
+        owner, repository, sorted(mentioned), status_field_name
+    )
+    if issues_by_number is None:
+        return False
+    for pr in pull_requests:
+        closing = pr.get("closingIssuesReferences") or {}
+        closing_issues = closing.get("nodes", [])
+        page = closing.get("pageInfo") or {}
+        if page.get("hasNextPage"):
+            rest = get_closing_issues(
+                owner, repository, pr["number"], status_field_name, page.get("endCursor")
+            )
+            if rest is None:
+                return False
+            closing_issues = closing_issues + rest
+        issues = {issue["id"]: issue for issue in closing_issues}
+        for number in pr.pop("mentions"):
+            issue = issues_by_number.get(number)
+            if issue:
+                issues.setdefault(issue["id"], issue)
+        pr["issues"] = list(issues.values())
+    return True
+
+
+def get_closing_issues(owner, repository, number, status_field_name, after):
+    """
+    Returns the issues the PR closes from the given cursor on, or None if
+    they couldn't be fetched.
+    """
+    variables = {
+        "owner": owner,
+        "repo": repository,
+        "number": number,
+        "status": status_field_name,
+    }
+    nodes = paginate(
+        "GetClosingIssues",
+        queries.GET_CLOSING_ISSUES,
+        variables,
+        ("repository", "pullRequest", "closingIssuesReferences"),
+        prefetch=False,
+        position=PagePosition(after),
+    )
+    try:
+        return list(nodes)
+    except PaginationError as e:
+        logging.error(f"Failed to fetch the issues PR #{number} closes: {e}")
+        return None
+
+
+def get_issues_by_number(owner, repository, numbers, status_field_name):
+    """
+    Looks up issues by number with one aliased query per 50 numbers.
+    Numbers that belong to pull requests or don't exist are left out.
+    Returns None if some of them couldn't be looked up.
+    """
+    results = {}
+    for start in range(0, len(numbers), 50):
+        chunk = numbers[start : start + 50]
+        query = queries.issues_by_number(chunk)
+        variables = {"owner": owner, "repo": repository, "status": status_field_name}
+        try:
+            data = _query(query, variables)
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"Request error: {e}")
+            return None
+        # Numbers that turn out to be pull requests come back as NOT_FOUND errors
+        errors = [
+            error for error in data.get("errors") or () if error.get("type") != "NOT_FOUND"
+        ]
+        repository_data = (data.get("data") or {}).get("repository")
+        if errors or repository_data is None:
+            logging.error(f"GraphQL query errors: {errors or data.get('errors')}")
+            return None
+        for issue in repository_data.values():
+            if issue:
+                results[issue["number"]] = issue
+    return results
+
+
+def get_issues(issue_ids, status_field_name):
+    """
+    Looks up the state and project items (queries.LINKED_ISSUE_FIELDS) of
+    issues by id, 50 per query. Issues that no longer exist are left out.
+    Returns None if some of them couldn't be looked up.
+    """
+    results = {}
+    for start in range(0, len(issue_ids), 50):
+        variables = {"ids": issue_ids[start : start + 50], "status": status_field_name}
+        try:
+            data = _query(queries.GET_ISSUES_PROJECT_ITEMS, variables)
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"Request error: {e}")
+            return None
+        # Deleted issues come back as NOT_FOUND errors
+        errors = [
+            error for error in data.get("errors") or () if error.get("type") != "NOT_FOUND"
+        ]
+        nodes = (data.get("data") or {}).get("nodes")
+        if errors or nodes is None:
+            logging.error(f"GraphQL query errors: {errors or data.get('errors')}")
+            return None
+        for issue in nodes:
+            if issue and issue.get("id"):
+                results[issue["id"]] = issue
+    return results
+
+
+def find_project_item(issue, project_id):
+    """
+    Returns the issue's models.ProjectItem in the given project, or None.
+    """
+    for item in (issue.get("projectItems") or {}).get("nodes", []):
+        if (item.get("project") or {}).get("id") == project_id:
+            field_value = item.get("fieldValueByName")
+            return ProjectItem(
+                item_id=item["id"],
+                status=field_value.get("name") if field_value else None,
+                issue=decode_issue(issue),
+            )
+    return None
@@ -0,0 +1,64 @@
+import re
+import state
+
+"""
+Ledger of the (issue, PR) pairs that already got a QA Testing comment
+"""
+
+LEDGER_FILE = "comment_ledger.json"
+MAX_ISSUES = 50000
+
+# Hidden in the rendered comment, lets the ledger be rebuilt from GitHub
+MARKER_PATTERN = re.compile(r"<!-- qatesting:pr=(\d+) -->")
+# Comments posted before the marker existed
+LEGACY_PATTERN = re.compile(
+    r"Testing will be available in 15 minutes \(triggered by \[PR #(\d+)\]"
+)
+
+
+def comment_marker(pr_number):
+    return f"<!-- qatesting:pr={pr_number} -->"
+
+
+def commented_pr_numbers(body):
+    """
+    Returns the PR numbers a comment body says it was posted for.
+    """
+    numbers = MARKER_PATTERN.findall(body or "") or LEGACY_PATTERN.findall(body or "")
+    return {int(number) for number in numbers}
+
+
+class CommentLedger:
+    def __init__(self, entries=None):
+        # issue id -> PR numbers, oldest issues first
+        self.entries = {
+            issue_id: set(numbers) for issue_id, numbers in (entries or {}).items()
+        }
+
+    def has(self, issue_id, pr_number):
+        return pr_number in self.entries.get(issue_id, ())
+
+    def record(self, issue_id, pr_number):
+        numbers = self.entries.pop(issue_id, set())
+        numbers.add(pr_number)
+        self.entries[issue_id] = numbers
+
+    def record_comments(self, issue_id, comments):
+        """
+        Rebuilds the ledger entries of an issue from its comments.
+        """
+        for comment in comments:
+            for pr_number in commented_pr_numbers(comment.get("body")):
+                self.record(issue_id, pr_number)
+
+    def to_dict(self):
+        issue_ids = list(self.entries)[-MAX_ISSUES:]
+        return {issue_id: sorted(self.entries[issue_id]) for issue_id in issue_ids}
+
+
+def load_ledger():
+    return CommentLedger(state.load_json(state.shard_file(LEDGER_FILE), {}))
+
+
+def save_ledger(ledger):
+    state.save_json(state.shard_file(LEDGER_FILE), ledger.to_dict())
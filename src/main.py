@@ -1,137 +1,739 @@
 from logger import logger
 import logging
 import json
+from datetime import timedelta
 import config
 import graphql
+from batching import BatchLoader, MutationBatcher
+from checkpoint import (
+    Deadline,
+    format_timestamp,
+    load_checkpoint,
+    parse_timestamp,
+    save_checkpoint,
+    utc_now,
+)
+from engine import map_concurrently
+from events import get_closed_pull_request
+from ledger import comment_marker, load_ledger, save_ledger
+from metadata import (
+    invalidate as invalidate_project_metadata,
+    is_unknown_id_error,
+    resolve_project_metadata,
+)
+from metrics import get_metrics, report_metrics
+from models import ProjectItem, decode_linked_pr
+from sharding import get_lease_backend, in_shard, lease_key, run_lock
+from store import close_store, get_store
+from targets import bound, get_targets, scheduled_targets, target_name
+from transport import close_transport
 
+# Share of the run budget spent discovering issues, the rest is left for
+# checking comments and sending the mutations
+DISCOVERY_SHARE = 0.75
 
-def check_comment_exists(issue_id, comment_text):
-    """Check if the comment already exists on the issue."""
-    comments = graphql.get_issue_comments(issue_id)
-    for comment in comments:
-        if comment_text in comment.get("body", ""):
-            return True
-    return False
 
+def is_updated_since(item, since):
+    """Check if the project item or its issue changed after the given timestamp."""
+    return item.last_updated() > since
+
+
+def resolve_metadata():
+    """
+    Returns the project id, status field id and 'QA Testing' option id, or None.
+    """
+    metadata = resolve_project_metadata(
+        owner=config.repository_owner,
+        project_title=config.project_title,
+        status_field_name=config.status_field_name,
+    )
+    if not metadata:
+        return None
+
+    status_option_id = metadata["status_options"].get("QA Testing")
+    if not status_option_id:
+        logging.error(
+            f"'QA Testing' option not found in project {config.project_title}"
+        )
+        return None
+
+    return {
+        "project_id": metadata["project_id"],
+        "status_field_id": metadata["status_field_id"],
+        "status_option_id": status_option_id,
+    }
+
+
+def chunked(iterable, size):
+    chunk = []
+    for element in iterable:
+        chunk.append(element)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def project_item_filters(updated_since=None):
+    """
+    Filters for the project items worth looking at, applied by the server
+    where possible (see graphql.project_items_filter).
+    """
+    return {
+        "open_only": True,
+        "issues_only": True,
+        "repository": config.repository if config.repository_only else None,
+        "exclude_statuses": config.exclude_statuses,
+        "updated_since": updated_since,
+    }
+
+
+def discover_from_issues(checkpoint, full_scan, metadata, deadline=None):
+    """
+    Walks the open issues and looks up the latest dev PR of each.
+    Returns (candidates, latest_prs, item_index, known_comments) for the issues
+    that have one, or None if the issues couldn't be fetched.
+
+    With a run budget (deadline), the issues updated since the previous run
+    are looked at first, and the walk (when full_scan) starts at the
+    checkpoint's resume cursor and stops once DISCOVERY_SHARE of the budget
+    is used, leaving the cursor for the next run.
+    """
+    deep = config.is_enterprise and config.deep_snapshot
+    viewer_login = graphql.get_viewer_login() if deep else None
+    if deep and not viewer_login:
+        # Without it the snapshot's comments can't be told apart, they are looked up instead
+        logging.warning("Could not resolve the token's login, checking comments without the snapshot")
+    budgeted = deadline is not None and deadline.seconds > 0
+    resumed_from = checkpoint.resume_cursor if budgeted else None
+    position = graphql.PagePosition(resumed_from)
+
+    updated_since = None if full_scan or budgeted else checkpoint.updated_since()
+    if updated_since:
+        logger.info(f"Incremental run: only looking at issues updated since {updated_since}")
+    filters = project_item_filters(updated_since)
 
-def notify_change_status():
     # Fetch issues based on whether it's an enterprise or not
     if config.is_enterprise:
-        issues = graphql.get_project_issues(
+        # Stream the project: each chunk of issues is looked up while the
+        # next page is still being fetched, and its items index themselves
+        pages = graphql.iter_project_items(
             owner=config.repository_owner,
             owner_type=config.repository_owner_type,
             project_number=config.project_number,
             status_field_name=config.status_field_name,
-            filters={"open_only": True},
+            deep=deep,
+            position=position,
+            filters=filters,
         )
+        issues = graphql.iter_filtered_project_items(pages, filters=filters)
+        item_index = None
     else:
-        issues = graphql.get_repo_issues(
-            owner=config.repository_owner, repository=config.repository_name
+        item_index = graphql.get_project_snapshot(
+            owner=config.repository_owner,
+            owner_type=config.repository_owner_type,
+            project_number=config.project_number,
+            status_field_name=config.status_field_name,
+            filters=project_item_filters(),
         )
+        if item_index is None:
+            logging.error("Failed to fetch the project items")
+            return None
+        pages = graphql.iter_repo_issues(
+            owner=config.repository_owner,
+            repository=config.repository_name,
+            position=position,
+        )
+        # Only the repository's issues that are on the project are of interest
+        issues = (item_index[issue.id] for issue in pages if issue.id in item_index)
 
-    if not issues:
-        logger.info("No issues have been found")
-        return
-
-    project_title = config.project_title
-    project_id = graphql.get_project_id_by_title(
-        owner=config.repository_owner, project_title=project_title
+    pr_loader = BatchLoader(
+        graphql.get_latest_merged_prs_into_dev, config.batch_size, config.concurrency
     )
-    if not project_id:
-        logging.error(f"Project {project_title} not found.")
-        return None
+    store = get_store()
+    candidates = []
+    latest_prs = {}
+    known_comments = {}
+    found_issues = False
+    index = {}
+    looked_up = set()
 
-    status_field_id = graphql.get_status_field_id(
-        project_id=project_id, status_field_name=config.status_field_name
-    )
-    if not status_field_id:
-        logging.error(f"Status field not found in project {project_title}")
-        return None
+    def look_up(chunk_candidates):
+        # Resolve the latest dev PR of the chunk in batched requests and
+        # only keep the issues that have one
+        looked_up.update(chunk_candidates)
+        chunk_prs = pr_loader.load_many(list(chunk_candidates))
+        if store:
+            store.record_latest_prs(chunk_prs)
+        for issue_id, (current_status, item_id) in chunk_candidates.items():
+            if not chunk_prs[issue_id]:
+                continue
+            candidates.append((issue_id, current_status))
+            latest_prs[issue_id] = chunk_prs[issue_id]
+            if item_index is None:
+                index[issue_id] = ProjectItem(item_id=item_id, status=current_status)
 
-    status_option_id = graphql.get_qatesting_status_option_id(
-        project_id=project_id, status_field_name=config.status_field_name
-    )
-    if not status_option_id:
-        logging.error(f"'QA Testing' option not found in project {project_title}")
+    try:
+        if budgeted and checkpoint.last_run_at:
+            found_issues = look_up_updated_issues(
+                checkpoint.updated_since(), metadata, look_up, deadline, store
+            )
+
+        # A budgeted run only walks everything while a full scan is due
+        if full_scan or not budgeted:
+            if resumed_from:
+                logger.info("Continuing the full scan where the previous run stopped")
+            checkpoint.resume_cursor = None
+            for chunk in chunked(issues, config.batch_size * config.concurrency):
+                found_issues = True
+                get_metrics().increment("scanned", len(chunk))
+                if store:
+                    store.record_items(metadata["project_id"], chunk)
+                chunk_candidates = {}
+                for item in chunk:
+                    issue = item.issue
+                    if issue is None or issue.state == "CLOSED":
+                        continue
+
+                    if updated_since and not is_updated_since(item, updated_since):
+                        continue
+
+                    if issue.id in looked_up or not in_shard(issue.id):
+                        continue
+
+                    chunk_candidates[issue.id] = (item.status, item.item_id)
+
+                    if deep:
+                        # The snapshot already holds the newest events and comments,
+                        # only truncated timelines need a follow-up request
+                        if not issue.timeline_truncated:
+                            pr_loader.prime_value(issue.id, issue.latest_pr)
+                        if issue.latest_pr and viewer_login:
+                            known_comments[issue.id] = graphql.comments_from_snapshot(
+                                issue, viewer_login
+                            )
+
+                look_up(chunk_candidates)
+                if budgeted and deadline.expired(DISCOVERY_SHARE):
+                    checkpoint.resume_cursor = position.after
+                    logger.info(
+                        f"Run budget of {config.run_budget}s nearly used, "
+                        "the next run continues the scan from here"
+                    )
+                    break
+    except graphql.PaginationError as e:
+        logging.error(f"Failed to fetch the issues: {e}")
+        if resumed_from and position.after == resumed_from:
+            # The saved cursor may no longer be valid, start the scan over next time
+            checkpoint.resume_cursor = None
+            save_checkpoint(checkpoint)
         return None
+    finally:
+        pages.close()
+
+    if not found_issues:
+        logger.info("No issues have been found")
+    if item_index is None:
+        item_index = index
+    return candidates, latest_prs, item_index, known_comments
 
-    items = graphql.get_project_items(
+
+def look_up_updated_issues(since, metadata, look_up, deadline, store=None):
+    """
+    Feeds the open project issues updated since the given timestamp, from
+    every repository on the board, to look_up in chunks until the run budget
+    runs short. Returns whether any were found.
+    """
+    found = False
+    filters = project_item_filters(since)
+    updated = graphql.iter_project_items(
         owner=config.repository_owner,
         owner_type=config.repository_owner_type,
         project_number=config.project_number,
         status_field_name=config.status_field_name,
+        filters=filters,
     )
+    try:
+        items = graphql.iter_filtered_project_items(updated, filters=filters)
+        for chunk in chunked(items, config.batch_size * config.concurrency):
+            get_metrics().increment("scanned", len(chunk))
+            if store:
+                store.record_items(metadata["project_id"], chunk)
+            chunk_candidates = {}
+            for item in chunk:
+                # The server rounds `since` down to its day
+                if not is_updated_since(item, since) or not in_shard(item.issue.id):
+                    continue
+                # Without enterprise_github only the repository's own issues are handled
+                if not config.is_enterprise and item.issue.repository != config.repository:
+                    continue
+                chunk_candidates[item.issue.id] = (item.status, item.item_id)
+            found = found or bool(chunk_candidates)
+            look_up(chunk_candidates)
+            if deadline.expired(DISCOVERY_SHARE):
+                break
+    finally:
+        updated.close()
+    if found:
+        logger.info(f"Looked at the issues updated since {since} first")
+    return found
 
-    for issue in issues:
-        if issue.get("state") == "CLOSED":
-            continue
 
-        issue_content = issue.get("content", {})
-        if not issue_content:
-            continue
+def discover_from_pull_requests(metadata, since):
+    """
+    Starts from the PRs merged into dev since the given timestamp and only
+    touches the issues they close or mention.
+    Returns (candidates, latest_prs, item_index, known_comments), or None if
+    the PRs couldn't be fetched.
+    """
+    pull_requests = graphql.get_merged_dev_pull_requests(
+        owner=config.repository_owner,
+        repository=config.repository_name,
+        status_field_name=config.status_field_name,
+        since=since,
+    )
+    if pull_requests is None:
+        logging.error("Failed to fetch the pull requests merged into dev")
+        return None
+    if not pull_requests:
+        logger.info("No merged pull requests have been found")
+        return [], {}, {}, {}
+
+    logger.info(f"Found {len(pull_requests)} PR(s) merged into dev since {since}")
+    get_metrics().increment("pull_requests_scanned", len(pull_requests))
+    return candidates_from_pull_requests(pull_requests, metadata["project_id"])
+
+
+def candidates_from_pull_requests(pull_requests, project_id):
+    """
+    Returns (candidates, latest_prs, item_index, known_comments) for the open
+    project issues linked to the given merged PRs.
+    """
+    candidates = []
+    latest_prs = {}
+    item_index = {}
+    for pr in pull_requests:
+        get_metrics().increment("scanned", len(pr["issues"]))
+        for issue in pr["issues"]:
+            if issue.get("state") != "OPEN":
+                continue
+            item = graphql.find_project_item(issue, project_id)
+            if not item or item.status in config.exclude_statuses:
+                continue
+
+            issue_id = issue["id"]
+            if not in_shard(issue_id):
+                continue
+            if issue_id not in item_index:
+                item_index[issue_id] = item
+                candidates.append((issue_id, item.status))
+
+            latest_pr = latest_prs.get(issue_id)
+            if latest_pr is None or pr["mergedAt"] > latest_pr.merged_at:
+                latest_prs[issue_id] = decode_linked_pr(pr)
+
+    store = get_store()
+    if store:
+        store.record_items(project_id, item_index.values())
+        store.record_latest_prs(latest_prs)
+    return candidates, latest_prs, item_index, {}
 
-        issue_id = issue_content.get("id")
-        if not issue_id:
+
+def apply_changes(
+    candidates, latest_prs, item_index, known_comments, metadata, ledger
+):
+    """
+    Moves every candidate with a new dev PR to QA Testing and comments on it,
+    skipping the (issue, PR) pairs the comment ledger says were already handled.
+
+    known_comments maps issue ids to (comments, complete_since) already at hand,
+    which spare the comment lookup when they reach back to the PR's merge.
+    """
+    get_metrics().increment("candidates", len(candidates))
+    store = get_store()
+    if store:
+        # Comments the store knows about needn't be looked up, even if the
+        # ledger lost them (it's capped, and may live in a different place)
+        for issue_id, pr_number in store.commented(
+            (issue_id, latest_prs[issue_id].number)
+            for issue_id, _ in candidates
+            if latest_prs.get(issue_id) and not ledger.has(issue_id, latest_prs[issue_id].number)
+        ):
+            ledger.record(issue_id, pr_number)
+    leases = get_lease_backend()
+    with get_metrics().phase("decide"):
+        planned = plan_changes(
+            candidates, latest_prs, item_index, known_comments, metadata, ledger, leases
+        )
+    with get_metrics().phase("mutate"):
+        send_changes(*planned, metadata, ledger, leases)
+
+    if store:
+        store.record_comments(
+            (issue_id, latest_prs[issue_id].number)
+            for issue_id, _ in candidates
+            if latest_prs.get(issue_id) and ledger.has(issue_id, latest_prs[issue_id].number)
+        )
+
+
+def with_pending_changes(work, project_id):
+    """
+    Adds the changes the store still has pending (e.g. a status update that
+    failed in a previous run) for issues this run didn't come across, which
+    an incremental run would otherwise only retry at the next full scan.
+
+    The store may not know that an issue was closed or left the project since,
+    so their state and status are looked up again first.
+    """
+    store = get_store()
+    if store is None:
+        return work
+    candidates, latest_prs, item_index, known_comments = work
+    pending_prs = store.pending_changes(project_id)
+    discovered = {issue_id for issue_id, _ in candidates}
+    pending_ids = [
+        issue_id
+        for issue_id in pending_prs
+        if issue_id not in discovered and in_shard(issue_id)
+    ]
+    if not pending_ids:
+        return work
+    issues = graphql.get_issues(pending_ids, config.status_field_name)
+    if issues is None:
+        logging.error("Could not refresh the pending changes, leaving them for the next run")
+        return work
+
+    refreshed = []
+    gone = []
+    added = 0
+    for issue_id in pending_ids:
+        issue = issues.get(issue_id)
+        item = graphql.find_project_item(issue, project_id) if issue else None
+        if item is None:
+            gone.append(issue_id)
+            continue
+        refreshed.append(item)
+        if item.issue.state != "OPEN" or item.status in config.exclude_statuses:
             continue
+        candidates.append((issue_id, item.status))
+        latest_prs[issue_id] = pending_prs[issue_id]
+        item_index[issue_id] = item
+        added += 1
+    # Closed issues are no longer pending, and gone ones no longer mirrored
+    store.record_items(project_id, refreshed)
+    store.remove_items(project_id, gone)
+    if added:
+        logger.info(f"Picked up {added} pending change(s) from the store")
+    return candidates, latest_prs, item_index, known_comments
+
+
+def plan_changes(
+    candidates, latest_prs, item_index, known_comments, metadata, ledger, leases
+):
+    """
+    Queues the status updates and comments to send. Returns (status_updates,
+    comments, pending_comments, triggering_prs): the two mutation batchers, the
+    comment to post once each status update succeeded, and the PR behind each.
+    Every queued (issue, PR) pair is leased first, pairs leased by an
+    overlapping run are left to it.
+    """
+
+    def claim(issue_id, pr_number):
+        if config.dry_run or leases.acquire(lease_key(issue_id, pr_number)):
+            return True
+        logger.info(f"PR #{pr_number} on issue {issue_id} is leased by another run, skipping it.")
+        get_metrics().increment("leased_elsewhere")
+        return False
 
-        field_value = issue.get("fieldValueByName")
-        current_status = field_value.get("name") if field_value else None
+    # Pairs missing from the ledger are checked against the comments posted
+    # since the PR was merged, fetched in batches
+    comment_loader = BatchLoader(
+        graphql.get_issues_comments_since, config.batch_size, config.concurrency
+    )
+    for issue_id, (comments, complete_since) in known_comments.items():
+        merged_at = latest_prs[issue_id].merged_at
+        if complete_since is None or complete_since <= merged_at:
+            comment_loader.prime_value((issue_id, merged_at), comments)
+    recent_comments = comment_loader.load_many(
+        (issue_id, latest_prs[issue_id].merged_at)
+        for issue_id, _ in candidates
+        if latest_prs.get(issue_id)
+        and not ledger.has(issue_id, latest_prs[issue_id].number)
+    )
+
+    status_updates = MutationBatcher(
+        graphql.send_mutation,
+        config.mutation_batch_size,
+        dry_run=config.dry_run,
+        concurrency=config.mutation_concurrency,
+    )
+    comments = MutationBatcher(
+        graphql.send_mutation,
+        config.mutation_batch_size,
+        dry_run=config.dry_run,
+        concurrency=config.mutation_concurrency,
+    )
+    pending_comments = {}
+    triggering_prs = {}
 
-        latest_pr = graphql.get_latest_merged_pr_into_dev(issue_id)
+    for issue_id, current_status in candidates:
+        latest_pr = latest_prs.get(issue_id)
         if not latest_pr:
             continue
 
-        pr_number = latest_pr["number"]
-        pr_url = latest_pr["url"]
+        pr_number = latest_pr.number
+        pr_url = latest_pr.url
 
-        comment_text = (
-            f"Testing will be available in 15 minutes "
-            f"(triggered by [PR #{pr_number}]({pr_url}))"
-        )
+        # Already handled by a previous run, no need to look at the comments
+        if ledger.has(issue_id, pr_number):
+            continue
+
+        issue_comments = recent_comments.get((issue_id, latest_pr.merged_at))
+        if issue_comments is None:
+            logger.error(f"Could not check the comments of issue {issue_id}, skipping it.")
+            continue
 
         # Skip if comment for this PR already exists
-        if check_comment_exists(issue_id, comment_text):
+        ledger.record_comments(issue_id, issue_comments)
+        if ledger.has(issue_id, pr_number):
             continue
 
+        comment_text = (
+            f"Testing will be available in 15 minutes "
+            f"(triggered by [PR #{pr_number}]({pr_url}))\n\n"
+            f"{comment_marker(pr_number)}"
+        )
+
         if current_status != "QA Testing":
             # Update status to QA Testing
+            item = item_index.get(issue_id)
+            if not item:
+                logger.warning(f"No matching item found for issue ID: {issue_id}.")
+                continue
+            if not claim(issue_id, pr_number):
+                continue
+
             logger.info(
                 f"Updating issue {issue_id} to QA Testing (triggered by PR #{pr_number})"
             )
-
-            item_found = False
-            for item in items:
-                if item.get("content") and item["content"].get("id") == issue_id:
-                    item_id = item["id"]
-                    item_found = True
-
-                    update_result = graphql.update_issue_status_to_qa_testing(
-                        owner=config.repository_owner,
-                        project_title=project_title,
-                        project_id=project_id,
-                        status_field_id=status_field_id,
-                        item_id=item_id,
-                        status_option_id=status_option_id,
-                    )
-
-                    if update_result:
-                        logger.info(
-                            f"Successfully updated issue {issue_id} to QA Testing."
-                        )
-                        graphql.add_issue_comment(issue_id, comment_text)
-                    else:
-                        logger.error(f"Failed to update issue {issue_id}.")
-                    break
-
-            if not item_found:
-                logger.warning(f"No matching item found for issue ID: {issue_id}.")
-                continue
+            triggering_prs[issue_id] = pr_number
+            status_updates.add(
+                issue_id,
+                graphql.status_update_operation(
+                    project_id=metadata["project_id"],
+                    status_field_id=metadata["status_field_id"],
+                    item_id=item.item_id,
+                    status_option_id=metadata["status_option_id"],
+                ),
+            )
+            pending_comments[issue_id] = comment_text
         else:
             # Already QA → just drop a new comment for the new PR
+            if not claim(issue_id, pr_number):
+                continue
             logger.info(
                 f"Issue {issue_id} already QA Testing → adding new comment for PR #{pr_number}"
             )
-            graphql.add_issue_comment(issue_id, comment_text)
+            triggering_prs[issue_id] = pr_number
+            comments.add(issue_id, graphql.add_comment_operation(issue_id, comment_text))
+
+    return status_updates, comments, pending_comments, triggering_prs
+
+
+def send_changes(
+    status_updates, comments, pending_comments, triggering_prs, metadata, ledger, leases
+):
+    """
+    Flushes the queued mutations and records the comments posted in the ledger.
+    Leases of the pairs that failed are released for the next run to retry;
+    the others are kept until they expire, by which time the comment is visible.
+    """
+    # Status updates go first; an issue is only commented on once its update succeeded
+    update_results = status_updates.flush()
+    if any(is_unknown_id_error(error, metadata) for error in status_updates.errors):
+        # The project, field or option IDs may have changed since they were cached
+        invalidate_project_metadata(
+            owner=config.repository_owner,
+            project_title=config.project_title,
+            status_field_name=config.status_field_name,
+        )
+
+    for issue_id, update_result in update_results.items():
+        if update_result:
+            logger.info(f"Successfully updated issue {issue_id} to QA Testing.")
+            get_metrics().increment("updated")
+            comments.add(
+                issue_id, graphql.add_comment_operation(issue_id, pending_comments[issue_id])
+            )
+        else:
+            logger.error(f"Failed to update issue {issue_id}.")
+            get_metrics().increment("failed")
+            leases.release(lease_key(issue_id, triggering_prs[issue_id]))
+
+    for issue_id, comment_result in comments.flush().items():
+        if not comment_result:
+            logger.error(f"Failed to comment on issue {issue_id}.")
+            get_metrics().increment("failed")
+            leases.release(lease_key(issue_id, triggering_prs[issue_id]))
+            continue
+        get_metrics().increment("commented")
+        if not config.dry_run:
+            ledger.record(issue_id, triggering_prs[issue_id])
+
+
+def notify_change_status():
+    """
+    Scans every configured project in turn, giving each an even share of
+    what is left of the run budget.
+    """
+    with run_lock() as locked:
+        if not locked:
+            logger.info("Another run is still scanning the project, exiting")
+            return None
+        targets = scheduled_targets()
+        deadline = Deadline(config.run_budget)
+        for position, target in enumerate(targets):
+            with bound(target):
+                if len(targets) > 1:
+                    logger.info(f"Scanning {target_name(target)}")
+                scan_project(deadline.split(len(targets) - position))
+
+
+def scan_project(deadline=None):
+    deadline = deadline or Deadline(config.run_budget)
+    with get_metrics().phase("fetch"):
+        metadata = resolve_metadata()
+    if not metadata:
+        return None
+
+    checkpoint = load_checkpoint()
+    run_started_at = utc_now()
+
+    if config.discovery_mode == "pull_requests":
+        full_scan = False
+        if checkpoint.last_run_at:
+            since = checkpoint.updated_since()
+        else:
+            since = format_timestamp(
+                run_started_at - timedelta(minutes=config.pull_request_lookback)
+            )
+        with get_metrics().phase("fetch"):
+            work = discover_from_pull_requests(metadata, since)
+        if work is None:
+            # Keep the checkpoint so the next run looks at the same window again
+            return None
+    else:
+        # A scan cut short by the run budget carries on regardless of the interval
+        full_scan = (
+            not config.incremental
+            or checkpoint.needs_full_scan(run_started_at)
+            or bool(config.run_budget and checkpoint.resume_cursor)
+        )
+        if full_scan and not checkpoint.resume_cursor:
+            checkpoint.sweep_started_at = format_timestamp(run_started_at)
+        with get_metrics().phase("fetch"):
+            work = discover_from_issues(checkpoint, full_scan, metadata, deadline)
+        if work is None:
+            # A failed fetch is not "no issues": keep the checkpoint for the next run
+            return None
+
+    if not full_scan:
+        work = with_pending_changes(work, metadata["project_id"])
+    candidates, latest_prs, item_index, known_comments = work
+    ledger = load_ledger()
+    apply_changes(
+        candidates, latest_prs, item_index, known_comments, metadata, ledger
+    )
+    save_ledger(ledger)
+
+    checkpoint.last_run_at = format_timestamp(run_started_at)
+    if full_scan and not checkpoint.resume_cursor:
+        checkpoint.last_full_scan_at = checkpoint.sweep_started_at or checkpoint.last_run_at
+        checkpoint.sweep_started_at = None
+        store = get_store()
+        if store:
+            # Items the completed scan didn't see are closed or gone
+            store.prune(
+                metadata["project_id"], parse_timestamp(checkpoint.last_full_scan_at).timestamp()
+            )
+    save_checkpoint(checkpoint)
+
+
+def is_merged_into_dev(event_pr):
+    number = event_pr.get("number")
+    if not event_pr.get("merged"):
+        logger.info(f"PR #{number} was closed without being merged, nothing to do")
+        return False
+    if (event_pr.get("base") or {}).get("ref") != "dev":
+        logger.info(f"PR #{number} was not merged into dev, nothing to do")
+        return False
+    return True
+
+
+def pull_request_repository(event_pr):
+    return ((event_pr.get("base") or {}).get("repo") or {}).get("full_name")
+
+
+def notify_merged_pull_requests(event_prs):
+    """
+    Handles `pull_request: closed` events without scanning the project, for
+    every configured project of the PR's repository.
+    """
+    default_repository = config.repository
+    for target in get_targets():
+        target_prs = [
+            pr
+            for pr in event_prs
+            if (pull_request_repository(pr) or default_repository) == target["repository"]
+        ]
+        if target_prs:
+            with bound(target):
+                handle_merged_pull_requests(target_prs)
+
+
+def handle_merged_pull_requests(event_prs):
+    numbers = [pr.get("number") for pr in event_prs if is_merged_into_dev(pr)]
+    if not numbers:
+        return None
+
+    with get_metrics().phase("fetch"):
+        metadata = resolve_metadata()
+        if not metadata:
+            return None
+
+        fetched = map_concurrently(
+            lambda number: graphql.get_pull_request(
+                owner=config.repository_owner,
+                repository=config.repository_name,
+                number=number,
+                status_field_name=config.status_field_name,
+            ),
+            numbers,
+            config.concurrency,
+        )
+    pull_requests = []
+    for number, pr in zip(numbers, fetched):
+        if not pr:
+            logging.error(f"Failed to fetch PR #{number}")
+        elif not pr.get("mergedAt") or pr.get("baseRefName") != "dev":
+            # The event payload isn't trusted, only what GitHub says about the PR
+            logging.warning(f"PR #{number} is not merged into dev, ignoring the event")
+        else:
+            pull_requests.append(pr)
+
+    candidates, latest_prs, item_index, known_comments = candidates_from_pull_requests(
+        pull_requests, metadata["project_id"]
+    )
+    if not candidates:
+        logger.info("The merged PR(s) don't reference any open issue in the project")
+        return None
+
+    ledger = load_ledger()
+    apply_changes(
+        candidates, latest_prs, item_index, known_comments, metadata, ledger
+    )
+    save_ledger(ledger)
 
 
 def main():
@@ -139,7 +741,24 @@ def main():
     if config.dry_run:
         logger.info("DRY RUN MODE ON!")
 
-    notify_change_status()
+    try:
+        if config.run_mode == "daemon":
+            # Imported lazily, the one-shot action never needs the HTTP server
+            from daemon import run_daemon
+
+            run_daemon()
+            return
+
+        event_pr = get_closed_pull_request()
+        if event_pr:
+            logger.info(f"Triggered by closed PR #{event_pr.get('number')}")
+            notify_merged_pull_requests([event_pr])
+        else:
+            notify_change_status()
+    finally:
+        close_transport()
+        close_store()
+        report_metrics()
 
 
 if __name__ == "__main__":
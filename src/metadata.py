@@ -0,0 +1,92 @@
+import logging
+import time
+import config
+import graphql
+import state
+
+"""
+Project, status field and option IDs, cached on disk between runs
+"""
+
+CACHE_FILE = "metadata.json"
+
+# Entries already read or fetched by this process, so a long-running daemon
+# doesn't go back to disk on every pass
+_memory_cache = {}
+
+
+def _cache_key(owner, project_title, status_field_name):
+    return f"{owner}/{project_title}/{status_field_name}"
+
+
+def resolve_project_metadata(owner, project_title, status_field_name):
+    """
+    Returns {"project_id", "status_field_id", "status_options"} for the project,
+    from the cache when it is younger than config.metadata_cache_ttl seconds.
+    Returns None if the project or its status field can't be found.
+    """
+    key = _cache_key(owner, project_title, status_field_name)
+    entry = _memory_cache.get(key)
+    if entry and _is_fresh(entry):
+        return entry
+
+    cache = state.load_json(CACHE_FILE, {})
+    entry = cache.get(key)
+    if entry and _is_fresh(entry):
+        _memory_cache[key] = entry
+        return entry
+
+    project_id = graphql.get_project_id_by_title(
+        owner=owner, project_title=project_title
+    )
+    if not project_id:
+        logging.error(f"Project {project_title} not found.")
+        return None
+
+    fields = graphql.get_project_fields(project_id)
+    status_field = graphql.find_status_field(fields, status_field_name)
+    if not status_field:
+        logging.error(f"Status field not found in project {project_title}")
+        return None
+
+    entry = {
+        "project_id": project_id,
+        "status_field_id": status_field["id"],
+        "status_options": {
+            option["name"]: option["id"] for option in status_field.get("options", [])
+        },
+        "fetched_at": time.time(),
+    }
+    cache[key] = entry
+    state.save_json(CACHE_FILE, cache)
+    _memory_cache[key] = entry
+    return entry
+
+
+def _is_fresh(entry):
+    return time.time() - entry.get("fetched_at", 0) < config.metadata_cache_ttl
+
+
+def invalidate(owner, project_title, status_field_name):
+    _memory_cache.pop(_cache_key(owner, project_title, status_field_name), None)
+    cache = state.load_json(CACHE_FILE, {})
+    if cache.pop(_cache_key(owner, project_title, status_field_name), None):
+        logging.info(f"Dropped cached metadata for project {project_title}")
+        state.save_json(CACHE_FILE, cache)
+
+
+def is_unknown_id_error(error, metadata):
+    """
+    True if a GraphQL error says one of the cached IDs of the metadata (the
+    project, status field or option) no longer exists. Errors about anything
+    else, like an item deleted meanwhile, leave the cache alone.
+    """
+    message = error.get("message", "")
+    if error.get("type") != "NOT_FOUND" and "Could not resolve to" not in message:
+        return False
+    cached_ids = (
+        metadata["project_id"],
+        metadata["status_field_id"],
+        metadata["status_option_id"],
+    )
+    return any(cached_id and cached_id in message for cached_id in cached_ids)
@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import config
+
+"""
+Per-run instrumentation: requests, latencies, bytes and point cost per query,
+item counts and phase timings, reported as a JSON summary and a Prometheus textfile
+"""
+
+QUANTILES = (0.5, 0.9, 0.99)
+PREFIX = "qatesting"
+
+
+def percentile(sorted_values, quantile):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(quantile * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def quantiles(sorted_values):
+    return {f"p{int(q * 100)}": round(percentile(sorted_values, q), 4) for q in QUANTILES}
+
+
+class Metrics:
+    """
+    Collects the measurements of a run; in daemon mode they add up over the
+    life of the process. Safe to update from the concurrent worker threads.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests = Counter()
+        self.failures = Counter()
+        self.latencies = defaultdict(list)
+        self.request_bytes = Counter()
+        self.response_bytes = Counter()
+        self.largest_responses = Counter()
+        self.costs = Counter()
+        self.counters = Counter()
+        self.gauges = {}
+        self.phases = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe_request(
+        self, operation, elapsed, status_code=None, request_bytes=0, response_bytes=0
+    ):
+        """
+        Records one HTTP request; a status_code of None means it never got a response.
+        """
+        with self._lock:
+            self.requests[operation] += 1
+            self.latencies[operation].append(elapsed)
+            self.request_bytes[operation] += request_bytes
+            self.response_bytes[operation] += response_bytes
+            self.largest_responses[operation] = max(
+                self.largest_responses[operation], response_bytes
+            )
+            if status_code is None or status_code >= 400:
+                self.failures[operation] += 1
+
+    def observe_cost(self, operation, cost):
+        with self._lock:
+            self.costs[operation] += cost or 0
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] += time.monotonic() - started
+
+    def summary(self):
+        with self._lock:
+            operations = {}
+            for operation in sorted(self.requests):
+                latencies = sorted(self.latencies[operation])
+                operations[operation] = {
+                    "requests": self.requests[operation],
+                    "failures": self.failures[operation],
+                    "latency_seconds": {
+                        **quantiles(latencies),
+                        "max": round(latencies[-1], 4) if latencies else 0.0,
+                        "sum": round(sum(latencies), 4),
+                    },
+                    "request_bytes": self.request_bytes[operation],
+                    "response_bytes": self.response_bytes[operation],
+                    "response_bytes_avg": round(
+                        self.response_bytes[operation] / self.requests[operation]
+                    ),
+                    "response_bytes_max": self.largest_responses[operation],
+                    "cost": self.costs[operation],
+                }
+            all_latencies = sorted(v for values in self.latencies.values() for v in values)
+            return {
+                "started_at": self.started_at,
+                "duration_seconds": round(time.time() - self.started_at, 3),
+                "dry_run": config.dry_run,
+                "requests": sum(self.requests.values()),
+                "failures": sum(self.failures.values()),
+                "latency_seconds": quantiles(all_latencies),
+                "request_bytes": sum(self.request_bytes.values()),
+                "response_bytes": sum(self.response_bytes.values()),
+                "cost": sum(self.costs.values()),
+                "items": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "phases_seconds": {name: round(s, 3) for name, s in self.phases.items()},
+                "operations": operations,
+            }
+
+    def prometheus(self):
+        summary = self.summary()
+        operations = summary["operations"]
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                if label_text:
+                    lines.append(f"{PREFIX}_{name}{{{label_text}}} {value}")
+                else:
+                    lines.append(f"{PREFIX}_{name} {value}")
+
+        def per_operation(key):
+            return [({"operation": op}, stats[key]) for op, stats in operations.items()]
+
+        metric(
+            "requests_total", "counter",
+            "GraphQL requests sent, retries included", per_operation("requests"),
+        )
+        metric(
+            "request_failures_total", "counter",
+            "GraphQL requests without a response or with an error status", per_operation("failures"),
+        )
+
+        latency_samples = []
+        for op, stats in operations.items():
+            latencies = stats["latency_seconds"]
+            for q in QUANTILES:
+                latency_samples.append(
+                    ({"operation": op, "quantile": str(q)}, latencies[f"p{int(q * 100)}"])
+                )
+        metric("request_duration_seconds", "summary", "GraphQL request latency", latency_samples)
+        for op, stats in operations.items():
+            lines.append(
+                f'{PREFIX}_request_duration_seconds_sum{{operation="{op}"}} {stats["latency_seconds"]["sum"]}'
+            )
+            lines.append(
+                f'{PREFIX}_request_duration_seconds_count{{operation="{op}"}} {stats["requests"]}'
+            )
+
+        metric(
+            "request_bytes_total", "counter",
+            "Bytes of GraphQL request bodies", per_operation("request_bytes"),
+        )
+        metric(
+            "response_bytes_total", "counter",
+            "Bytes of GraphQL response bodies, decompressed", per_operation("response_bytes"),
+        )
+        metric(
+            "response_size_max_bytes", "gauge",
+            "Largest GraphQL response body, decompressed", per_operation("response_bytes_max"),
+        )
+        metric(
+            "rate_limit_cost_total", "counter",
+            "Rate limit points reported by rateLimit { cost }, 1 per mutation", per_operation("cost"),
+        )
+        metric(
+            "items_total", "counter", "Issues handled by the run, by outcome",
+            [({"kind": kind}, value) for kind, value in sorted(summary["items"].items())],
+        )
+        metric(
+            "phase_duration_seconds", "gauge", "Time spent in each phase of the run",
+            [({"phase": name}, value) for name, value in sorted(summary["phases_seconds"].items())],
+        )
+        if summary["gauges"].get("rate_limit_remaining") is not None:
+            metric(
+                "rate_limit_remaining", "gauge", "Rate limit points left after the run",
+                [({}, summary["gauges"]["rate_limit_remaining"])],
+            )
+        metric("run_duration_seconds", "gauge", "Duration of the run", [({}, summary["duration_seconds"])])
+        metric(
+            "last_run_timestamp_seconds", "gauge", "When the run finished",
+            [({}, round(time.time(), 3))],
+        )
+        return "\n".join(lines) + "\n"
+
+    def log_summary(self):
+        summary = self.summary()
+        items = ", ".join(f"{k}={v}" for k, v in sorted(summary["items"].items())) or "none"
+        phases = ", ".join(f"{k}={v:.2f}s" for k, v in summary["phases_seconds"].items()) or "none"
+        logging.info(
+            f"Run took {summary['duration_seconds']:.2f}s: {summary['requests']} requests "
+            f"({summary['failures']} failed, p50 {summary['latency_seconds']['p50']:.3f}s, "
+            f"p99 {summary['latency_seconds']['p99']:.3f}s), "
+            f"{summary['response_bytes'] / 1024:.1f} KB received, cost {summary['cost']}; "
+            f"items: {items}; phases: {phases}"
+        )
+        for operation, s in summary["operations"].items():
+            logging.info(
+                f"  {operation}: {s['requests']} requests, p50 {s['latency_seconds']['p50']:.3f}s, "
+                f"{s['response_bytes'] / 1024:.1f} KB ({s['response_bytes_avg'] / 1024:.1f} KB "
+                f"per response, largest {s['response_bytes_max'] / 1024:.1f} KB), cost {s['cost']}"
+            )
+
+
+def _write_atomically(path, text):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+def report_metrics():
+    """
+    Logs the run summary and writes the configured JSON and Prometheus files.
+    """
+    _metrics.log_summary()
+    try:
+        if config.metrics_path:
+            _write_atomically(config.metrics_path, json.dumps(_metrics.summary(), indent=2))
+        if config.metrics_textfile:
+            _write_atomically(config.metrics_textfile, _metrics.prometheus())
+    except OSError as e:
+        logging.warning(f"Could not write the metrics: {e}")
@@ -0,0 +1,97 @@
+from dataclasses import dataclass
+import requests
+
+try:
+    import orjson
+except ImportError:  # Optional, the standard json module is used without it
+    orjson = None
+
+"""
+Compact records for the project items, issues and linked PRs a run works on,
+decoded from GraphQL nodes keeping only the fields the decisions need
+"""
+
+
+@dataclass(slots=True)
+class LinkedPR:
+    number: int
+    url: str
+    merged_at: str
+
+
+@dataclass(slots=True)
+class Issue:
+    id: str
+    number: int | None = None
+    state: str | None = None
+    updated_at: str = ""
+    # "owner/name", only set for project items
+    repository: str | None = None
+    # Only set from a deep snapshot: the newest dev PR among the nested
+    # events, whether older events were left out, and the nested comments
+    # written by the viewer with the timestamp they're complete from
+    latest_pr: LinkedPR | None = None
+    timeline_truncated: bool = True
+    comments: list | None = None
+    comments_complete_since: str | None = None
+
+
+@dataclass(slots=True)
+class ProjectItem:
+    item_id: str
+    status: str | None
+    updated_at: str = ""
+    # None for draft issues and pull requests
+    issue: Issue | None = None
+
+    def last_updated(self):
+        """The later of the item's and its issue's last update."""
+        issue_updated_at = self.issue.updated_at if self.issue else ""
+        return max(self.updated_at, issue_updated_at)
+
+
+def decode_json(response):
+    """
+    Decodes a response body, with orjson when it is installed. Decoding
+    errors are raised as requests' JSONDecodeError either way.
+    """
+    if orjson is None:
+        return response.json()
+    try:
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError as e:
+        raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos) from e
+
+
+def decode_linked_pr(node):
+    return LinkedPR(number=node["number"], url=node["url"], merged_at=node["mergedAt"])
+
+
+def decode_issue(node):
+    return Issue(
+        id=node["id"],
+        number=node.get("number"),
+        state=node.get("state"),
+        updated_at=node.get("updatedAt") or "",
+        repository=(node.get("repository") or {}).get("nameWithOwner"),
+    )
+
+
+def decode_project_item(node, snapshot_decoder=None):
+    """
+    Builds a ProjectItem from a node of the project items query. The nested
+    deep snapshot fields, if any, are reduced by snapshot_decoder(issue, content).
+    """
+    field_value = node.get("fieldValueByName")
+    content = node.get("content") or {}
+    issue = None
+    if content.get("id"):
+        issue = decode_issue(content)
+        if snapshot_decoder:
+            snapshot_decoder(issue, content)
+    return ProjectItem(
+        item_id=node["id"],
+        status=field_value.get("name") if field_value else None,
+        updated_at=node.get("updatedAt") or "",
+        issue=issue,
+    )
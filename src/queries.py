@@ -0,0 +1,303 @@
+from functools import lru_cache
+import re
+
+"""
+The GraphQL documents the action sends, built once and compacted (batched
+mutations are assembled by batching.py). Each selects only the fields its
+caller reads; when a caller starts reading a new field, add it here.
+"""
+
+
+def compact(document):
+    """Collapses the indentation, which only adds bytes to every request."""
+    return re.sub(r"\s*([{}():,])\s*", r"\1", " ".join(document.split()))
+
+
+# Fragments
+
+# Only the events that can link a PR are requested
+TIMELINE_FIELDS = """
+  nodes {
+    __typename
+    ... on CrossReferencedEvent {
+      source { ... on PullRequest { number mergedAt url baseRefName } }
+    }
+    ... on ConnectedEvent {
+      source { ... on PullRequest { number mergedAt url baseRefName } }
+      subject { ... on PullRequest { number mergedAt url baseRefName } }
+    }
+  }
+  pageInfo { startCursor hasPreviousPage }
+"""
+
+# Nested per issue by the deep project snapshot
+DEEP_NESTED_COUNT = 5
+
+DEEP_ISSUE_FIELDS = f"""
+  timelineItems(
+    last: {DEEP_NESTED_COUNT},
+    itemTypes: [CROSS_REFERENCED_EVENT, CONNECTED_EVENT]
+  ) {{{TIMELINE_FIELDS}}}
+  comments(last: {DEEP_NESTED_COUNT}) {{
+    nodes {{ body createdAt author {{ login }} }}
+    pageInfo {{ startCursor hasPreviousPage }}
+  }}
+"""
+
+LINKED_ISSUE_FIELDS = """
+  id
+  number
+  state
+  projectItems(first: 20) {
+    nodes {
+      id
+      project { id }
+      fieldValueByName(name: $status) {
+        ... on ProjectV2ItemFieldSingleSelectValue { name }
+      }
+    }
+  }
+"""
+
+# Queries
+
+GET_VIEWER = compact("""
+query GetViewer {
+  viewer { login }
+  rateLimit { cost remaining resetAt }
+}
+""")
+
+GET_PROJECT_BY_TITLE = compact("""
+query GetProjectByTitle($owner: String!, $projectTitle: String!) {
+  organization(login: $owner) {
+    projectsV2(first: 10, query: $projectTitle) {
+      nodes { id title }
+    }
+  }
+  rateLimit { cost remaining resetAt }
+}
+""")
+
+GET_PROJECT_FIELDS = compact("""
+query GetProjectFields($projectId: ID!) {
+  node(id: $projectId) {
+    ... on ProjectV2 {
+      fields(first: 100) {
+        nodes {
+          __typename
+          ... on ProjectV2SingleSelectField {
+            id
+            name
+            options { id name }
+          }
+        }
+      }
+    }
+  }
+  rateLimit { cost remaining resetAt }
+}
+""")
+
+GET_REPO_ISSUES = compact("""
+query GetRepoOpenIssues($owner: String!, $repo: String!, $first: Int!, $after: String) {
+  repository(owner: $owner, name: $repo) {
+    issues(first: $first, after: $after, states: [OPEN]) {
+      nodes { id number updatedAt }
+      pageInfo { endCursor hasNextPage }
+    }
+  }
+  rateLimit { cost remaining resetAt }
+}
+""")
+
+
+@lru_cache(maxsize=None)
+def project_items(owner_type, deep=False, filtered=False):
+    """
+    The project items query for an owner type ("organization" or "user"),
+    with the deep snapshot fields and with the items(query:) filter argument.
+    """
+    name = "GetProjectItemsDeep" if deep else "GetProjectItems"
+    filter_declaration = ", $query: String!" if filtered else ""
+    filter_argument = ", query: $query" if filtered else ""
+    deep_fields = DEEP_ISSUE_FIELDS if deep else ""
+    return compact(f"""
+query {name}($owner: String!, $projectNumber: Int!, $status: String!, $first: Int!, $after: String{filter_declaration}) {{
+  {owner_type}(login: $owner) {{
+    projectV2(number: $projectNumber) {{
+      items(first: $first, after: $after{filter_argument}) {{
+        nodes {{
+          id
+          updatedAt
+          fieldValueByName(name: $status) {{
+            ... on ProjectV2ItemFieldSingleSelectValue {{ name }}
+          }}
+          content {{
+            ... on Issue {{
+              id
+              number
+              state
+              updatedAt
+              repository {{ nameWithOwner }}
+              {deep_fields}
+            }}
+          }}
+        }}
+        pageInfo {{ endCursor hasNextPage }}
+      }}
+    }}
+  }}
+  rateLimit {{ cost remaining resetAt }}
+}}
+""")
+
+
+GET_ISSUE_TIMELINE = compact(f"""
+query GetIssueTimeline($issueId: ID!, $last: Int!, $before: String, $since: DateTime) {{
+  node(id: $issueId) {{
+    ... on Issue {{
+      timelineItems(
+        last: $last,
+        before: $before,
+        since: $since,
+        itemTypes: [CROSS_REFERENCED_EVENT, CONNECTED_EVENT]
+      ) {{{TIMELINE_FIELDS}}}
+    }}
+  }}
+  rateLimit {{ cost remaining resetAt }}
+}}
+""")
+
+GET_ISSUES_TIMELINES = compact(f"""
+query GetIssuesTimelines($ids: [ID!]!, $last: Int!, $since: DateTime) {{
+  nodes(ids: $ids) {{
+    ... on Issue {{
+      id
+      timelineItems(
+        last: $last,
+        since: $since,
+        itemTypes: [CROSS_REFERENCED_EVENT, CONNECTED_EVENT]
+      ) {{{TIMELINE_FIELDS}}}
+    }}
+  }}
+  rateLimit {{ cost remaining resetAt }}
+}}
+""")
+
+GET_ISSUE_COMMENTS_SINCE = compact("""
+query GetIssueCommentsSince($issueId: ID!, $last: Int!, $before: String) {
+  node(id: $issueId) {
+    ... on Issue {
+      comments(last: $last, before: $before) {
+        nodes { body createdAt }
+        pageInfo { startCursor hasPreviousPage }
+      }
+    }
+  }
+  rateLimit { cost remaining resetAt }
+}
+""")
+
+GET_ISSUES_COMMENTS_SINCE = compact("""
+query GetIssuesCommentsSince($ids: [ID!]!, $last: Int!) {
+  nodes(ids: $ids) {
+    ... on Issue {
+      id
+      comments(last: $last) {
+        nodes { body createdAt }
+        pageInfo { startCursor hasPreviousPage }
+      }
+    }
+  }
+  rateLimit { cost remaining resetAt }
+}
+""")
+
+GET_MERGED_DEV_PULL_REQUESTS = compact(f"""
+query GetMergedDevPullRequests($owner: String!, $repo: String!, $status: String!, $after: String) {{
+  repository(owner: $owner, name: $repo) {{
+    pullRequests(
+      first: 50,
+      after: $after,
+      baseRefName: "dev",
+      states: [MERGED],
+      orderBy: {{field: UPDATED_AT, direction: DESC}}
+    ) {{
+      nodes {{
+        number
+        url
+        title
+        body
+        mergedAt
+        updatedAt
+        closingIssuesReferences(first: 25) {{
+          nodes {{{LINKED_ISSUE_FIELDS}}}
+          pageInfo {{ endCursor hasNextPage }}
+        }}
+      }}
+      pageInfo {{ endCursor hasNextPage }}
+    }}
+  }}
+  rateLimit {{ cost remaining resetAt }}
+}}
+""")
+
+GET_PULL_REQUEST = compact(f"""
+query GetPullRequest($owner: String!, $repo: String!, $number: Int!, $status: String!) {{
+  repository(owner: $owner, name: $repo) {{
+    pullRequest(number: $number) {{
+      number
+      url
+      title
+      body
+      mergedAt
+      baseRefName
+      closingIssuesReferences(first: 25) {{
+        nodes {{{LINKED_ISSUE_FIELDS}}}
+        pageInfo {{ endCursor hasNextPage }}
+      }}
+    }}
+  }}
+  rateLimit {{ cost remaining resetAt }}
+}}
+""")
+
+# The rest of the issues a PR closes, when there are more than the PR queries list
+GET_CLOSING_ISSUES = compact(f"""
+query GetClosingIssues($owner: String!, $repo: String!, $number: Int!, $status: String!, $first: Int!, $after: String) {{
+  repository(owner: $owner, name: $repo) {{
+    pullRequest(number: $number) {{
+      closingIssuesReferences(first: $first, after: $after) {{
+        nodes {{{LINKED_ISSUE_FIELDS}}}
+        pageInfo {{ endCursor hasNextPage }}
+      }}
+    }}
+  }}
+  rateLimit {{ cost remaining resetAt }}
+}}
+""")
+
+# Refreshes the state and project items of issues known by id
+GET_ISSUES_PROJECT_ITEMS = compact(f"""
+query GetIssuesProjectItems($ids: [ID!]!, $status: String!) {{
+  nodes(ids: $ids) {{
+    ... on Issue {{{LINKED_ISSUE_FIELDS}}}
+  }}
+  rateLimit {{ cost remaining resetAt }}
+}}
+""")
+
+
+def issues_by_number(numbers):
+    """Looks up the given issue numbers as aliased fields, issue<number>."""
+    fields = " ".join(
+        f"issue{int(number)}: issue(number: {int(number)}) {{{LINKED_ISSUE_FIELDS}}}"
+        for number in numbers
+    )
+    return compact(f"""
+query GetIssuesByNumber($owner: String!, $repo: String!, $status: String!) {{
+  repository(owner: $owner, name: $repo) {{ {fields} }}
+  rateLimit {{ cost remaining resetAt }}
+}}
+""")
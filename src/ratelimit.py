@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+import config
+
+"""
+Keeping GraphQL traffic within GitHub's primary and secondary rate limits
+"""
+
+
+class RateLimiter:
+    """
+    Tracks the point budget reported by the X-RateLimit-* response headers and
+    by `rateLimit { remaining }` selections, pauses before a
+    request when the budget is nearly used up, and works out how long to back
+    off after a rate-limited response.
+    """
+
+    def __init__(self, reserve=50, max_wait=900):
+        self.reserve = reserve
+        self.max_wait = max_wait
+        self.remaining = None
+        self.reset_at = None
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self.remaining is None or self.remaining > self.reserve:
+                return
+            wait = self.reset_at - time.time() if self.reset_at else 0
+        if wait > 0:
+            wait = min(wait + 1, self.max_wait)
+            logging.warning(
+                f"Only {self.remaining} rate limit points left, pausing {wait:.0f}s until the reset"
+            )
+            time.sleep(wait)
+            with self._lock:
+                self.remaining = None
+
+    def observe(self, response):
+        headers = response.headers
+        with self._lock:
+            if headers.get("X-RateLimit-Remaining") is not None:
+                self.remaining = int(headers["X-RateLimit-Remaining"])
+            if headers.get("X-RateLimit-Reset") is not None:
+                self.reset_at = int(headers["X-RateLimit-Reset"])
+
+    def observe_cost(self, rate_limit):
+        """
+        Records the `rateLimit { cost remaining resetAt }` selection of a response.
+        """
+        if not rate_limit:
+            return
+        with self._lock:
+            if rate_limit.get("remaining") is not None:
+                self.remaining = rate_limit["remaining"]
+
+    def backoff_seconds(self, response, attempt):
+        """
+        Seconds to wait before retrying a rate-limited response, or None if the
+        response wasn't rate limited.
+        """
+        if response.status_code not in (403, 429):
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            return min(float(retry_after), self.max_wait)
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset_at = int(response.headers.get("X-RateLimit-Reset") or 0)
+            return min(max(reset_at - time.time(), 1), self.max_wait)
+        if "secondary rate limit" in response.text.lower():
+            # No hint from the server, back off exponentially starting at a minute
+            return min(60 * (2**attempt), self.max_wait)
+        return None
+
+
+class PageSizer:
+    """
+    Adapts the `first:` page size of a paginated query so each page stays
+    within a target response time and a target point cost (the
+    `rateLimit { cost }` of the page), shrinking it after failed pages.
+    Pages of the same query may be fetched from several threads at once.
+    """
+
+    def __init__(self, maximum=100, minimum=10, target_seconds=5.0, target_cost=10):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.target_seconds = target_seconds
+        self.target_cost = target_cost
+        self.size = maximum
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, cost=None):
+        with self._lock:
+            self._record(elapsed, cost)
+
+    def _record(self, elapsed, cost):
+        if cost and self.target_cost and cost > self.target_cost:
+            # The cost grows with the page size, scale it down to fit
+            self.size = max(self.minimum, self.size * self.target_cost // cost)
+        elif elapsed > self.target_seconds:
+            self.size = max(self.minimum, self.size // 2)
+        elif elapsed < self.target_seconds / 4:
+            grown = min(self.maximum, self.size + self.size // 2)
+            # Only grow while the bigger page is expected to stay within the cost
+            if not cost or not self.target_cost or cost * grown <= self.target_cost * self.size:
+                self.size = grown
+
+    def shrink(self):
+        with self._lock:
+            self.size = max(self.minimum, self.size // 2)
+
+
+_page_sizers = {}
+_page_sizers_lock = threading.Lock()
+
+
+def page_sizer(query_name, maximum=None):
+    """
+    Returns the page sizer shared by every call of the given query.
+    """
+    with _page_sizers_lock:
+        if query_name not in _page_sizers:
+            _page_sizers[query_name] = PageSizer(
+                maximum=min(maximum or config.page_size, config.page_size),
+                target_seconds=config.page_target_seconds,
+                target_cost=config.page_target_cost,
+            )
+        return _page_sizers[query_name]
@@ -0,0 +1,205 @@
+import fcntl
+import hashlib
+import importlib
+import json
+import logging
+import os
+import socket
+import time
+from contextlib import contextmanager
+import config
+
+"""
+Splitting a project across parallel runs: a stable hash partition of the
+issues, and leases that keep overlapping runs from commenting twice
+"""
+
+
+def shard_of(key, shard_count):
+    # Python's hash() is salted per process, every runner has to agree
+    digest = hashlib.sha1(key.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def in_shard(key, shard_index=None, shard_count=None):
+    shard_index = config.shard_index if shard_index is None else shard_index
+    shard_count = config.shard_count if shard_count is None else shard_count
+    return shard_count <= 1 or shard_of(key, shard_count) == shard_index
+
+
+def lease_key(issue_id, pr_number):
+    return f"{issue_id}:{pr_number}"
+
+
+class NoLeases:
+    """
+    The default backend: every lease is granted.
+    """
+
+    def acquire(self, key):
+        return True
+
+    def release(self, key):
+        pass
+
+
+class FileLeases:
+    """
+    One file per lease in a directory every run can reach (a shared mount on
+    self-hosted runners). Creating the file with O_EXCL is the atomic claim;
+    a lease older than its ttl is considered abandoned and taken over.
+
+    Taking over and releasing happen under an flock on a guard file in the
+    directory, so a lease is only ever replaced after checking it's still
+    the expired one, and never removed once it belongs to someone else.
+    Leases kept until they expire are pruned by the next run's first acquire.
+    """
+
+    GUARD_FILE = ".guard"
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._pruned = False
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".lease")
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # Being written right now, or corrupt: judge it by its age
+            try:
+                return {"expires_at": os.path.getmtime(path) + self.ttl}
+            except OSError:
+                return None
+
+    def _lease(self, key):
+        return {"key": key, "owner": self.owner, "expires_at": time.time() + self.ttl}
+
+    @contextmanager
+    def _guarded(self):
+        # The lock goes away with the process, a crashed run can't leave it held
+        with open(os.path.join(self.directory, self.GUARD_FILE), "a") as guard:
+            fcntl.flock(guard, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(guard, fcntl.LOCK_UN)
+
+    def _take_over(self, path, key):
+        """
+        Replaces the lease at path with ours if it's still expired. Returns
+        True if taken over, False if it's held, None if it's gone meanwhile.
+        """
+        with self._guarded():
+            lease = self._read(path)
+            if lease is None:
+                return None
+            if lease.get("expires_at", 0) > time.time():
+                return False
+            logging.info(f"Taking over the expired lease on {key}")
+            tmp_path = f"{path}.{self.owner}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._lease(key), f)
+            # The lease file is swapped, never missing, so no O_EXCL claim can slip in
+            os.replace(tmp_path, path)
+            return True
+
+    def prune(self):
+        """Removes the expired leases and leftover temporary files."""
+        now = time.time()
+        removed = 0
+        with self._guarded():
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".lease"):
+                    lease = self._read(entry.path)
+                    expired = lease is not None and lease.get("expires_at", 0) <= now
+                elif entry.name.endswith(".tmp"):
+                    # Left behind by a run that died while taking over a lease
+                    try:
+                        expired = entry.stat().st_mtime + self.ttl <= now
+                    except OSError:
+                        expired = False
+                else:
+                    continue
+                if expired:
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+        if removed:
+            logging.info(f"Pruned {removed} expired lease file(s) from {self.directory}")
+
+    def acquire(self, key):
+        if not self._pruned:
+            self._pruned = True
+            self.prune()
+        path = self._path(key)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                lease = self._read(path)
+                if lease and lease.get("expires_at", 0) > time.time():
+                    return False
+                taken_over = self._take_over(path, key)
+                if taken_over is None:
+                    # Released meanwhile, claim it afresh
+                    continue
+                return taken_over
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._lease(key), f)
+            return True
+        return False
+
+    def release(self, key):
+        path = self._path(key)
+        with self._guarded():
+            lease = self._read(path)
+            if lease and lease.get("owner") == self.owner:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+@contextmanager
+def run_lock():
+    """
+    Holds this shard's scan lock for the duration of the block and yields
+    whether it was acquired. Always acquired when config.run_lock is off.
+    """
+    if not config.run_lock:
+        yield True
+        return
+    leases = FileLeases(config.lease_dir, config.run_lock_ttl)
+    key = f"run:{config.shard_index}/{config.shard_count}"
+    if not leases.acquire(key):
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        leases.release(key)
+
+
+def get_lease_backend():
+    """
+    Builds the backend named by config.lease_backend. Any other backend can be
+    plugged in as "module:Class", a class with acquire(key) -> bool and
+    release(key) that takes no arguments.
+    """
+    if config.lease_backend == "none":
+        return NoLeases()
+    if config.lease_backend == "file":
+        return FileLeases(config.lease_dir, config.lease_ttl)
+    module_name, _, class_name = config.lease_backend.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import config
+
+"""
+Small JSON files persisted between runs in config.state_dir
+"""
+
+
+def state_path(name):
+    return os.path.join(config.state_dir, name)
+
+
+def shard_file(name):
+    """
+    Per-shard name of a state file, so shards sharing a state dir don't
+    overwrite each other's checkpoint or ledger.
+    """
+    if config.shard_count <= 1:
+        return name
+    base, extension = os.path.splitext(name)
+    return f"{base}.shard-{config.shard_index}-of-{config.shard_count}{extension}"
+
+
+def target_file(name):
+    """
+    Per-shard name of a state file that belongs to one project, also made
+    per-project when several are configured (config.projects).
+    """
+    name = shard_file(name)
+    if not config.projects:
+        return name
+    base, extension = os.path.splitext(name)
+    target = re.sub(r"[^\w.-]+", "-", f"{config.repository}-{config.project_number}")
+    return f"{base}.{target}{extension}"
+
+
+def load_json(name, default=None):
+    try:
+        with open(state_path(name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable state file {name}: {e}")
+        return default
+
+
+def save_json(name, data):
+    path = state_path(name)
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # A temporary file of its own, shards may be saving the same file at once
+        with tempfile.NamedTemporaryFile(
+            "w", dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp", delete=False
+        ) as f:
+            json.dump(data, f)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.remove(f.name)
+            raise
+    except OSError as e:
+        logging.warning(f"Could not write state file {name}: {e}")
@@ -0,0 +1,239 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import config
+from models import LinkedPR
+
+"""
+Optional SQLite mirror of the project: items with their issue state and
+status, the latest dev PR of each issue and the QA comments posted, kept up to
+date by every fetch and mutation so pending changes can be found with one query
+and known comments needn't be looked up again
+"""
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    issue_id TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    state TEXT,
+    status TEXT,
+    updated_at TEXT,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (project_id, issue_id)
+);
+CREATE INDEX IF NOT EXISTS items_by_state ON items (project_id, state, status);
+CREATE INDEX IF NOT EXISTS items_by_seen_at ON items (project_id, seen_at);
+
+CREATE TABLE IF NOT EXISTS linked_prs (
+    issue_id TEXT PRIMARY KEY,
+    pr_number INTEGER NOT NULL,
+    pr_url TEXT NOT NULL,
+    merged_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS qa_comments (
+    issue_id TEXT NOT NULL,
+    pr_number INTEGER NOT NULL,
+    PRIMARY KEY (issue_id, pr_number)
+);
+"""
+
+# Items of the project last seen open whose latest dev PR hasn't been commented on yet
+PENDING_CHANGES = """
+SELECT items.issue_id, linked_prs.pr_number, linked_prs.pr_url, linked_prs.merged_at
+FROM items
+JOIN linked_prs ON linked_prs.issue_id = items.issue_id
+LEFT JOIN qa_comments
+    ON qa_comments.issue_id = linked_prs.issue_id
+    AND qa_comments.pr_number = linked_prs.pr_number
+WHERE items.project_id = ? AND items.state = 'OPEN' AND qa_comments.issue_id IS NULL
+ORDER BY linked_prs.merged_at
+"""
+
+
+class ProjectStore:
+    """
+    The mirror in a SQLite file. Writes come from the run's thread and, in
+    daemon mode, the webhook worker; a lock keeps them one at a time.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Shards sharing the file wait for each other's writes
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._lock, self.connection:
+            version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, SCHEMA_VERSION):
+                raise sqlite3.DatabaseError(f"Unsupported store schema version {version}")
+            self.connection.executescript(SCHEMA)
+            self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _write(self, statement, rows):
+        # The mirror is best effort, a failed write never fails the run
+        try:
+            with self._lock, self.connection:
+                self.connection.executemany(statement, rows)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not update the store: {e}")
+
+    def record_items(self, project_id, items):
+        """Upserts project items (models.ProjectItem with their issue) as seen now."""
+        now = time.time()
+        rows = [
+            (
+                item.issue.id,
+                project_id,
+                item.item_id,
+                item.issue.state,
+                item.status,
+                item.last_updated(),
+                now,
+            )
+            for item in items
+            if item.issue
+        ]
+        self._write(
+            """
+            INSERT INTO items (issue_id, project_id, item_id, state, status, updated_at, seen_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (project_id, issue_id) DO UPDATE SET
+                item_id = excluded.item_id,
+                state = COALESCE(excluded.state, items.state),
+                status = excluded.status,
+                updated_at = MAX(excluded.updated_at, items.updated_at),
+                seen_at = excluded.seen_at
+            """,
+            rows,
+        )
+
+    def record_latest_prs(self, latest_prs):
+        """Upserts the latest dev PR (models.LinkedPR) of each issue id, newest wins."""
+        rows = [
+            (issue_id, pr.number, pr.url, pr.merged_at)
+            for issue_id, pr in latest_prs.items()
+            if pr
+        ]
+        self._write(
+            """
+            INSERT INTO linked_prs (issue_id, pr_number, pr_url, merged_at)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (issue_id) DO UPDATE SET
+                pr_number = excluded.pr_number,
+                pr_url = excluded.pr_url,
+                merged_at = excluded.merged_at
+            WHERE excluded.merged_at >= linked_prs.merged_at
+            """,
+            rows,
+        )
+
+    def record_comments(self, pairs):
+        """Records the (issue_id, pr_number) pairs known to have a QA comment."""
+        self._write(
+            "INSERT OR IGNORE INTO qa_comments (issue_id, pr_number) VALUES (?, ?)",
+            list(pairs),
+        )
+
+    def remove_items(self, project_id, issue_ids):
+        """Drops the given issues' items, e.g. once they left the project."""
+        self._write(
+            "DELETE FROM items WHERE project_id = ? AND issue_id = ?",
+            [(project_id, issue_id) for issue_id in issue_ids],
+        )
+
+    def prune(self, project_id, seen_before):
+        """
+        Drops the items a complete scan didn't come across: closed, moved out
+        of the project, or excluded.
+        """
+        try:
+            with self._lock, self.connection:
+                deleted = self.connection.execute(
+                    "DELETE FROM items WHERE project_id = ? AND seen_at < ?",
+                    (project_id, seen_before),
+                ).rowcount
+        except sqlite3.Error as e:
+            logging.warning(f"Could not update the store: {e}")
+            return
+        if deleted:
+            logging.info(f"Dropped {deleted} item(s) no longer on the project from the store")
+
+    def pending_changes(self, project_id):
+        """
+        Returns {issue_id: models.LinkedPR} for the items last seen open whose
+        latest dev PR has no QA comment yet, oldest merge first.
+        """
+        try:
+            with self._lock:
+                rows = self.connection.execute(PENDING_CHANGES, (project_id,)).fetchall()
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read the store: {e}")
+            rows = []
+        return {
+            issue_id: LinkedPR(number=pr_number, url=pr_url, merged_at=merged_at)
+            for issue_id, pr_number, pr_url, merged_at in rows
+        }
+
+    def commented(self, pairs):
+        """Returns those of the (issue_id, pr_number) pairs that have a QA comment."""
+        pairs = list(pairs)
+        found = set()
+        # Two parameters a pair, well within SQLite's limit of 999 per statement
+        for start in range(0, len(pairs), 400):
+            chunk = pairs[start : start + 400]
+            values = ", ".join("(?, ?)" for _ in chunk)
+            try:
+                with self._lock:
+                    rows = self.connection.execute(
+                        f"""
+                        SELECT issue_id, pr_number FROM qa_comments
+                        WHERE (issue_id, pr_number) IN (VALUES {values})
+                        """,
+                        [value for pair in chunk for value in pair],
+                    ).fetchall()
+            except sqlite3.Error as e:
+                logging.warning(f"Could not read the store: {e}")
+                return found
+            found.update(rows)
+        return found
+
+    def close(self):
+        self.connection.close()
+
+
+_store = None
+# Set once opening the store failed, so it isn't retried on every call
+_unavailable = False
+
+
+def get_store():
+    """
+    Returns the store at config.store_path, or None when it's disabled or
+    can't be opened (the run then goes on without it).
+    """
+    global _store, _unavailable
+    if not config.store_path or _unavailable:
+        return None
+    if _store is None:
+        try:
+            _store = ProjectStore(config.store_path)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Could not open the store {config.store_path}: {e}")
+            _unavailable = True
+            return None
+    return _store
+
+
+def close_store():
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+import config
+import state
+
+"""
+Several repositories and projects served by one process. While a target is
+processed its settings replace the per-project ones in config; the transport,
+rate limiter, metadata cache and comment ledger stay shared.
+"""
+
+TARGETS_FILE = "targets.json"
+
+# Keys of an INPUT_PROJECTS entry (named like the action inputs) and the
+# config setting each one overrides
+TARGET_SETTINGS = {
+    "repository": "repository",
+    "repository_owner_type": "repository_owner_type",
+    "project_number": "project_number",
+    "project_title": "project_title",
+    "status_field_name": "status_field_name",
+    "enterprise_github": "is_enterprise",
+}
+
+
+def get_targets():
+    """
+    Returns the settings of every configured target; without config.projects,
+    the single project given by the inputs.
+    """
+    defaults = {key: getattr(config, setting) for key, setting in TARGET_SETTINGS.items()}
+    targets = []
+    for entry in config.projects or [{}]:
+        unknown = set(entry) - set(TARGET_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown keys in a projects entry: {', '.join(sorted(unknown))}")
+        target = dict(defaults, **entry)
+        target["project_number"] = int(target["project_number"])
+        target["enterprise_github"] = target["enterprise_github"] in (True, "True")
+        targets.append(target)
+    return targets
+
+
+def target_name(target):
+    return f"{target['repository']}#{target['project_number']}"
+
+
+def scheduled_targets():
+    """
+    The targets in the order this run should process them. The order rotates
+    by one every run, so when the run budget runs out it isn't always the
+    same targets that get the least of it.
+    """
+    targets = get_targets()
+    if len(targets) <= 1:
+        return targets
+    saved = state.load_json(state.shard_file(TARGETS_FILE), {})
+    start = saved.get("next", 0) % len(targets)
+    state.save_json(state.shard_file(TARGETS_FILE), {"next": (start + 1) % len(targets)})
+    return targets[start:] + targets[:start]
+
+
+@contextmanager
+def bound(target):
+    """Points config at the target for the duration of the block."""
+    settings = list(TARGET_SETTINGS.values()) + ["repository_owner", "repository_name"]
+    previous = {setting: getattr(config, setting) for setting in settings}
+    for key, setting in TARGET_SETTINGS.items():
+        setattr(config, setting, target[key])
+    config.repository_owner, config.repository_name = target["repository"].split("/", 1)
+    try:
+        yield target
+    finally:
+        for setting, value in previous.items():
+            setattr(config, setting, value)
@@ -0,0 +1,229 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+import config
+from cassette import Cassette, CassetteMiss, operation_name
+from metrics import get_metrics
+from ratelimit import RateLimiter
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class Transport:
+    """
+    Pooled, keep-alive HTTP session shared by every GraphQL query and mutation.
+    """
+
+    def __init__(
+        self,
+        endpoint,
+        token,
+        pool_size=10,
+        timeout=30,
+        max_retries=3,
+        backoff_factor=0.5,
+        rate_limiter=None,
+    ):
+        self.endpoint = endpoint
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        # Requests sent per operation name, retries included; posted from worker threads
+        self.request_counts = Counter()
+        self._counts_lock = threading.Lock()
+        self.session = requests.Session()
+        self.session.headers.update(
+            {
+                "Authorization": f"Bearer {token}",
+                "Accept-Encoding": "gzip, deflate",
+            }
+        )
+        # Retries are left to post(), so a dead endpoint isn't retried both
+        # here and there with the attempts multiplying
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def post(self, query, variables=None, headers=None, idempotent=True):
+        """
+        Sends a GraphQL document and returns the raw response.
+
+        Queries (idempotent=True) are retried with backoff on 5xx responses and
+        failed connections; mutations are not, so a comment is never posted twice.
+        Rate-limited responses were not applied, so both are retried once the
+        limit allows it. A response still unsuccessful after that raises
+        requests.HTTPError, so it is never mistaken for an answer.
+        """
+        attempt = 0
+        limited = 0
+        while True:
+            self.rate_limiter.before_request()
+            operation = operation_name(query)
+            with self._counts_lock:
+                self.request_counts[operation] += 1
+            started = time.monotonic()
+            try:
+                response = self._send(query, variables, headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                get_metrics().observe_request(operation, time.monotonic() - started)
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                logging.warning(f"Request failed ({e}), retrying...")
+            else:
+                request_body = response.request.body if response.request else None
+                get_metrics().observe_request(
+                    operation,
+                    time.monotonic() - started,
+                    response.status_code,
+                    request_bytes=len(request_body or b""),
+                    response_bytes=len(response.content),
+                )
+                self.rate_limiter.observe(response)
+                get_metrics().set_gauge("rate_limit_remaining", self.rate_limiter.remaining)
+                wait = self.rate_limiter.backoff_seconds(response, limited)
+                if wait is not None and limited < self.max_retries:
+                    logging.warning(f"Rate limited, retrying in {wait:.0f}s...")
+                    time.sleep(wait)
+                    limited += 1
+                    continue
+                if (
+                    not idempotent
+                    or response.status_code not in RETRY_STATUSES
+                    or attempt >= self.max_retries
+                ):
+                    response.raise_for_status()
+                    return response
+                logging.warning(
+                    f"Server responded {response.status_code}, retrying..."
+                )
+            time.sleep(self.backoff_factor * (2**attempt))
+            attempt += 1
+
+    def _send(self, query, variables, headers):
+        return self.session.post(
+            self.endpoint,
+            json={"query": query, "variables": variables},
+            headers=headers,
+            timeout=self.timeout,
+        )
+
+    def close(self):
+        self.session.close()
+
+
+class RecordingTransport(Transport):
+    """
+    A live transport that also writes every request and response to a
+    cassette, with the token scrubbed, when it is closed. An existing
+    cassette is appended to, so consecutive runs can be captured together.
+    """
+
+    def __init__(self, endpoint, token, cassette_path, context=None, **kwargs):
+        super().__init__(endpoint, token, **kwargs)
+        self.cassette = Cassette(cassette_path, secrets=[token], context=context)
+        if os.path.exists(cassette_path):
+            self.cassette.interactions = Cassette.load(cassette_path).interactions
+
+    def _send(self, query, variables, headers):
+        response = super()._send(query, variables, headers)
+        self.cassette.record(
+            query, variables, response.status_code, response.headers, response.content
+        )
+        return response
+
+    def close(self):
+        super().close()
+        self.cassette.save()
+
+
+class ReplayTransport(Transport):
+    """
+    Answers requests from a recorded cassette without touching the network.
+    A request that wasn't recorded raises CassetteMiss, which isn't retried.
+    """
+
+    def __init__(self, endpoint, token, cassette_path, **kwargs):
+        super().__init__(endpoint, token, **kwargs)
+        self.cassette = Cassette.load(cassette_path)
+
+    def _send(self, query, variables, headers):
+        interaction = self.cassette.find(query, variables)
+        if interaction is None:
+            raise CassetteMiss(
+                f"No recorded response for {operation_name(query)} with {variables}"
+            )
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response.headers = CaseInsensitiveDict(interaction["headers"])
+        response._content = interaction["body"].encode()
+        response.encoding = "utf-8"
+        response.url = self.endpoint
+        return response
+
+
+_transport = None
+
+
+def get_transport():
+    """
+    Returns the process-wide transport, creating it on first use.
+    """
+    global _transport
+    if _transport is None:
+        transport_class, options = Transport, {}
+        if config.transport_mode == "record":
+            transport_class = RecordingTransport
+            options = {
+                "cassette_path": config.cassette_path,
+                "context": recording_context(),
+            }
+        elif config.transport_mode == "replay":
+            transport_class = ReplayTransport
+            options = {"cassette_path": config.cassette_path}
+        _transport = transport_class(
+            endpoint=config.api_endpoint,
+            token=config.gh_token,
+            pool_size=config.http_pool_size,
+            timeout=config.http_timeout,
+            max_retries=config.http_max_retries,
+            backoff_factor=config.http_backoff_factor,
+            rate_limiter=RateLimiter(
+                reserve=config.rate_limit_reserve,
+                max_wait=config.rate_limit_max_wait,
+            ),
+            **options,
+        )
+    return _transport
+
+
+def recording_context():
+    """
+    The settings a cassette was recorded with; replaying needs the same
+    ones, since they end up in the request variables.
+    """
+    return {
+        "GITHUB_REPOSITORY_OWNER": config.repository_owner,
+        "GITHUB_REPOSITORY": config.repository,
+        "INPUT_REPOSITORY_OWNER_TYPE": config.repository_owner_type,
+        "INPUT_ENTERPRISE_GITHUB": str(config.is_enterprise),
+        "INPUT_PROJECT_NUMBER": str(config.project_number),
+        "INPUT_PROJECT_TITLE": config.project_title,
+        "INPUT_STATUS_FIELD_NAME": config.status_field_name,
+    }
+
+
+def close_transport():
+    """
+    Closes the process-wide transport, writing the cassette when recording.
+    """
+    global _transport
+    if _transport is None:
+        return
+    _transport.close()
+    _transport = None